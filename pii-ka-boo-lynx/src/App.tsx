@@ -11,11 +11,11 @@ import PlusWhiteIcon from './assets/plus-white.png';
 import SparklesIcon from './assets/sparkles.png';
 import UserIcon from './assets/user.png';
 
+import { redactMessage, callGemini } from './services/apiService.js';
 import {
-  sendMessage as apiSendMessage,
-  callGemini,
-} from './services/apiService.js';
-import { replacePlaceholdersFromOriginal } from './services/piiReplacementService.js';
+  replacePlaceholdersFromOriginal,
+  restorePlaceholders,
+} from './services/piiReplacementService.js';
 
 interface Message {
   id: string;
@@ -182,7 +182,8 @@ export function App(props: { onRender?: () => void }) {
     }
 
     try {
-      const robot = await apiSendMessage(currentText);
+      const { response: robot, placeholders } =
+        await redactMessage(currentText);
 
       const robotMessage: Message = {
         id:
@@ -209,7 +210,9 @@ export function App(props: { onRender?: () => void }) {
       };
       setMessages((prev) => [...prev, geminiMessage]);
 
-      const restored = replacePlaceholdersFromOriginal(currentText, gemini);
+      const restored = placeholders
+        ? restorePlaceholders(gemini, placeholders)
+        : replacePlaceholdersFromOriginal(currentText, gemini);
       const restoredMessage: Message = {
         id:
           (Date.now() + 3).toString() +
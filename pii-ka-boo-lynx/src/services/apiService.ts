@@ -1,3 +1,5 @@
+import type { PlaceholderTable } from './piiReplacementService.js';
+
 export interface PiiAnalysis {
   hasPII: boolean;
   scrubbedText: string;
@@ -10,7 +12,12 @@ export function analyzePII(text: string): PiiAnalysis {
   };
 }
 
-export async function sendMessage(text: string): Promise<string> {
+export interface RedactResult {
+  response: string;
+  placeholders?: PlaceholderTable;
+}
+
+export async function redactMessage(text: string): Promise<RedactResult> {
   // Call local Next API /api/text
   const res = await fetch('http://localhost:3000/api/text', {
     method: 'POST',
@@ -19,7 +26,11 @@ export async function sendMessage(text: string): Promise<string> {
   });
   if (!res.ok) throw new Error('text API error');
   const data = await res.json();
-  return data.response || '';
+  return { response: data.response || '', placeholders: data.placeholders };
+}
+
+export async function sendMessage(text: string): Promise<string> {
+  return (await redactMessage(text)).response;
 }
 
 export async function callGemini(text: string): Promise<string> {
@@ -0,0 +1,67 @@
+"""
+Images per second of EasyOCREngine.extract_batch against one extract() call per image.
+
+Run from pii-ka-boo-web/app/api/images/image_detection/:
+
+    python benchmarks/ocr_batch.py --input data --images 32 --batch-size 4
+"""
+import argparse
+import itertools
+import json
+import os
+import sys
+import time
+from pathlib import Path
+
+import cv2
+
+# Add the parent directory to sys.path to import the custom module
+parent_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.append(parent_dir)
+from text_redactor.ocr.easyocr_engine import EasyOCREngine
+
+def load_images(path: Path, count: int):
+    files = [path] if path.is_file() else sorted(
+        p for p in path.rglob("*") if p.suffix.lower() in {".jpg", ".jpeg", ".png"})
+    images = [img for img in (cv2.imread(str(p)) for p in files) if img is not None]
+    if not images:
+        raise SystemExit(f"No images found under {path}")
+    return list(itertools.islice(itertools.cycle(images), count))
+
+def same_boxes(a, b):
+    return [(x.text, x.bbox) for x in a] == [(x.text, x.bbox) for x in b]
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark batched OCR against per-image OCR.")
+    parser.add_argument("--input", default="data", help="Image file or folder of images.")
+    parser.add_argument("--images", type=int, default=16, help="Images to OCR, cycling through the input.")
+    parser.add_argument("--batch-size", type=int, default=4, help="Images per detection pass.")
+    parser.add_argument("--recog-batch-size", type=int, default=16, help="Text crops per recognition pass.")
+    parser.add_argument("--workers", type=int, default=0, help="Recognition dataloader workers.")
+    parser.add_argument("--bucket", type=int, default=128, help="Size step images are padded up to.")
+    args = parser.parse_args()
+
+    images = load_images(Path(args.input), args.images)
+    engine = EasyOCREngine(langs=["en"], batch_size=args.batch_size, recog_batch_size=args.recog_batch_size,
+                           workers=args.workers, bucket=args.bucket)
+    engine.extract_array(images[0])  # warm up
+
+    start = time.perf_counter()
+    single = [engine.extract_array(img) for img in images]
+    t_single = time.perf_counter() - start
+
+    start = time.perf_counter()
+    batched = engine.extract_batch(images)
+    t_batched = time.perf_counter() - start
+
+    print(json.dumps({
+        "images": len(images),
+        "batch_size": args.batch_size,
+        "images_per_s_single": round(len(images) / t_single, 2),
+        "images_per_s_batched": round(len(images) / t_batched, 2),
+        "speedup": round(t_single / t_batched, 2),
+        "same_boxes": sum(same_boxes(a, b) for a, b in zip(single, batched)),
+    }, indent=2))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,90 @@
+"""
+Speed and agreement of adaptive-resolution detection against full-resolution OCR.
+
+A full-resolution box counts as recovered when the adaptive run has a box
+with the same text overlapping it by IoU >= 0.5. Run from
+pii-ka-boo-web/app/api/images/image_detection/:
+
+    python benchmarks/ocr_resolution.py --input data --max-detect-pixels 2000000
+"""
+import argparse
+import json
+import os
+import sys
+import time
+from pathlib import Path
+
+import cv2
+
+# Add the parent directory to sys.path to import the custom module
+parent_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.append(parent_dir)
+from core.types import Mask
+from text_redactor.ocr.easyocr_engine import EasyOCREngine
+
+def iou(a, b):
+    ma, mb = Mask.from_polygon(a.bbox), Mask.from_polygon(b.bbox)
+    x0, y0 = max(ma.x, mb.x), max(ma.y, mb.y)
+    x1, y1 = min(ma.x + ma.w, mb.x + mb.w), min(ma.y + ma.h, mb.y + mb.h)
+    inter = max(0, x1 - x0) * max(0, y1 - y0)
+    union = ma.w * ma.h + mb.w * mb.h - inter
+    return inter / union if union else 0.0
+
+def recovered(full, adaptive):
+    return sum(any(b.text == a.text and iou(a, b) >= 0.5 for b in adaptive) for a in full)
+
+def timed(engine, img):
+    start = time.perf_counter()
+    boxes = engine.extract_array(img)
+    return time.perf_counter() - start, boxes
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare adaptive-resolution OCR with full-resolution OCR.")
+    parser.add_argument("--input", default="data", help="Image file or folder of images.")
+    parser.add_argument("--max-detect-pixels", type=int, default=2_000_000)
+    parser.add_argument("--min-text-height", type=int, default=16)
+    args = parser.parse_args()
+
+    path = Path(args.input)
+    files = [path] if path.is_file() else sorted(
+        p for p in path.rglob("*") if p.suffix.lower() in {".jpg", ".jpeg", ".png"})
+
+    full = EasyOCREngine(langs=["en"])
+    adaptive = EasyOCREngine(langs=["en"], max_detect_pixels=args.max_detect_pixels,
+                             min_text_height=args.min_text_height)
+    # Share one reader so the models are only loaded once
+    adaptive.reader = full.reader
+    warmed = False
+
+    rows = []
+    for f in files:
+        img = cv2.imread(str(f))
+        if img is None:
+            continue
+        if not warmed:
+            timed(full, img)
+            warmed = True
+        t_full, boxes_full = timed(full, img)
+        t_adaptive, boxes_adaptive = timed(adaptive, img)
+        rows.append({
+            "image": f.name,
+            "megapixels": round(img.shape[0] * img.shape[1] / 1e6, 2),
+            "detect_scale": round(adaptive.detection_scale(*img.shape[:2]), 3),
+            "full_s": round(t_full, 3),
+            "adaptive_s": round(t_adaptive, 3),
+            "boxes_full": len(boxes_full),
+            "boxes_adaptive": len(boxes_adaptive),
+            "recall": round(recovered(boxes_full, boxes_adaptive) / max(1, len(boxes_full)), 4),
+        })
+
+    total_full = sum(r["full_s"] for r in rows)
+    total_adaptive = sum(r["adaptive_s"] for r in rows)
+    print(json.dumps({
+        "images": len(rows),
+        "speedup": round(total_full / total_adaptive, 2) if total_adaptive else None,
+        "mean_recall": round(sum(r["recall"] for r in rows) / max(1, len(rows)), 4),
+        "per_image": rows,
+    }, indent=2))
+
+if __name__ == "__main__":
+    main()
@@ -97,7 +97,8 @@ class GeoCamPipeline:
 
         mask = self._heat_to_mask(heat_union, self.cfg.mask_top_p, self.cfg.dilate)
 
-        out = img.copy()
+        # The heatmap is done with img, so blur it in place rather than copying it
+        out = img
 
         pixel_threshold = 0.5
         binmask = (mask >= pixel_threshold).astype(np.uint8) * 255
@@ -1,4 +1,6 @@
 import argparse
+import contextlib
+import itertools
 import os
 import cv2
 from pathlib import Path
@@ -14,14 +16,14 @@ parent_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
 sys.path.append(parent_dir)
 from text_redactor.pii_blur.pipeline import PipelineConfig, PIIBlurPipeline
 
-def iter_images(path: Path):
+def iter_images(path: Path, suffixes=(".jpg", ".jpeg", ".png")):
     if path.is_file():
         yield path
     else:
         for root, _, files in os.walk(path):
             for filename in files:
                 filepath = Path(root) / filename
-                if filepath.suffix.lower() in {".jpg", ".jpeg", ".png"}:
+                if filepath.suffix.lower() in suffixes:
                     yield filepath
 
 def clean_path(path: str) -> str:
@@ -32,13 +34,31 @@ def clean_path(path: str) -> str:
     except UnicodeDecodeError:
         raise ValueError(f"Path contains characters that cannot be decoded: {path}")
 
+def process_stdin(config_path: str, ext: str):
+    """Redact one encoded image read from stdin and write the encoded result to stdout."""
+    out = sys.stdout
+    # stdout carries the image, so anything the models print goes to stderr
+    with contextlib.redirect_stdout(sys.stderr):
+        pipe = PIIBlurPipeline(PipelineConfig.from_json(config_path))
+        result = pipe.process_bytes(sys.stdin.buffer.read(), ext=ext)
+    out.buffer.write(result["bytes"])
+    out.buffer.flush()
+    print(f"Redacted image from stdin (PII tags: {result['num_pii_tags']})", file=sys.stderr)
+
 def main():
     parser = argparse.ArgumentParser(description="Automatic PII and GeoLocation blurring for images.")
-    parser.add_argument("--input", required=True, help="Path to an image file or a folder of images.")
-    parser.add_argument("--output", required=True, help="Output folder for redacted images.")
+    parser.add_argument("--input", required=True, help="Path to an image file or a folder of images, or - for stdin.")
+    parser.add_argument("--output", required=True, help="Output folder for redacted images, or - for stdout.")
     parser.add_argument("--config", default="config.json", help="Path to JSON config.")
+    parser.add_argument("--format", default=".png", help="Output encoding when writing to stdout.")
+    parser.add_argument("--tiled", action="store_true", help="Process each image in overlapping tiles to bound memory.")
     args = parser.parse_args()
 
+    if args.input == "-" and args.output == "-":
+        # Decode, redact and encode in memory without touching disk
+        process_stdin(args.config, args.format)
+        return True
+
     in_path = clean_path(str(args.input))
     out_dir = clean_path(str(args.output))
     out_dir_path = Path(out_dir)
@@ -48,16 +68,48 @@ def main():
     pipe = PIIBlurPipeline(cfg)
     print(f"Processing images from {in_path} to {out_dir} using config {args.config}")
     
-    for img_path in iter_images(Path(in_path)):
+    if args.tiled:
+        for img_path in iter_images(Path(in_path), (".jpg", ".jpeg", ".png", ".tif", ".tiff", ".npy")):
+            try:
+                out_path = out_dir_path / img_path.name
+                result = pipe.process_tiled(str(img_path), str(out_path))
+                print(f"Saved redacted image -> {out_path} (PII tags: {result['num_pii_tags']})")
+            except Exception as e:
+                print(f"Failed on {img_path}: {e}")
+        return False
+
+    # Hold a few OCR batches' worth of images so similar sizes can share a batch
+    paths = iter_images(Path(in_path))
+    for group in iter(lambda: list(itertools.islice(paths, cfg.ocr_batch_size * 4)), []):
+        loaded = []
+        for img_path in group:
+            img = cv2.imread(str(img_path))
+            if img is None:
+                print(f"Failed on {img_path}: Could not read image")
+            else:
+                loaded.append((img_path, img))
         try:
-            result = pipe.process_image(str(img_path))
+            results = pipe.process_arrays([img for _, img in loaded])
+        except Exception:
+            # Find the image that broke the batch, and keep the others
+            results = []
+            for img_path, img in loaded:
+                try:
+                    results.append(pipe.process_array(img))
+                except Exception as e:
+                    print(f"Failed on {img_path}: {e}")
+                    results.append(None)
+        for (img_path, _), result in zip(loaded, results):
+            if result is None:
+                continue
             out_path = out_dir_path / img_path.name
             cv2.imwrite(str(out_path), result["image"])
             print(f"Saved redacted image -> {out_path} (PII tags: {result['num_pii_tags']})")
-        except Exception as e:
-            print(f"Failed on {img_path}: {e}")
+    if pipe.ocr_cache is not None:
+        print(f"OCR cache: {pipe.ocr_cache.snapshot()}")
 
 if __name__ == "__main__":
-    main()
+    to_stdout = main()
     # After processing is done, print "Success" to indicate completion
-    print("Success")
+    # (on stderr when stdout carries the image)
+    print("Success", file=sys.stderr if to_stdout else sys.stdout)
@@ -1,7 +1,8 @@
 import os
-from typing import List, Iterable
+from typing import Dict, List, Iterable, Tuple
 from transformers import pipeline
 from core.types import BBox, PIIType
+from text_redactor.detector.text_blocks import text_blocks, has_word_chars
 
 MODEL_DIR = os.path.join(os.path.dirname(__file__), "model")
 
@@ -11,7 +12,8 @@ class PiiranhaDetector:
         self,
         model_name: str = "iiiorg/piiranha-v1-detect-personal-information",
         target_entities: Iterable[str] = None,
-        min_confidence_score: float = 0.50
+        min_confidence_score: float = 0.50,
+        token_budget: int = 4096
     ):
         self.pipe = pipeline(
             task="token-classification",
@@ -20,25 +22,66 @@ class PiiranhaDetector:
         )
         self.target = set(e.upper() for e in (target_entities or []))
         self.min_confidence_score = float(min_confidence_score)
+        # Most tokens, padding included, in one forward pass
+        self.token_budget = max(1, int(token_budget))
 
     def detect(self, ocr: List[BBox]) -> List[PIIType]:
-        tags: List[PIIType] = []
-        for i, box in enumerate(ocr):
-            text = (box.text or "").strip()
-            if not text:
-                continue
-
-            results = self.pipe(text)
-            print(results)
-            best = {}
+        return self.detect_batch([ocr])[0]
+
+    def detect_batch(self, ocrs: List[List[BBox]]) -> List[List[PIIType]]:
+        """
+        Classify the boxes of several images, returning one tag list per image.
+
+        Boxes are joined into reading-order blocks so the model sees the
+        words around each box; boxes that are empty or only punctuation are
+        left out. The blocks of all images go through the model together in
+        padded batches (see _classify), and token offsets map every result
+        back to the box it came from, keeping the best score per label per
+        box.
+        """
+        blocks = [(n, block) for n, ocr in enumerate(ocrs) for block in text_blocks(ocr, keep=has_word_chars)]
+        outputs = self._classify([block.text for _, block in blocks])
+
+        best: List[Dict[Tuple[int, str], float]] = [{} for _ in ocrs]
+        for (n, block), results in zip(blocks, outputs):
             for r in results:
                 label = (r.get("entity_group") or r.get("entity") or "").upper()
                 score = float(r["score"])
                 if self.target and label not in self.target:
                     continue
-                if score >= self.min_confidence_score and score > best.get(label, 0.0):
-                    best[label] = score
+                if score < self.min_confidence_score:
+                    continue
+                for i in block.boxes_in(r["start"], r["end"]):
+                    if score > best[n].get((i, label), 0.0):
+                        best[n][(i, label)] = score
+        return [[PIIType(entity_type=label, score=score, box_index=i) for (i, label), score in sorted(found.items())]
+                for found in best]
+
+    def _classify(self, texts: List[str]) -> List[list]:
+        """
+        Run the pipeline over texts, returning its results in input order.
+
+        Texts are sorted by token count and packed into batches whose size
+        times their longest text stays within token_budget, so each batch is
+        padded to about the same length and no forward pass is one short
+        string.
+        """
+        if not texts:
+            return []
+        lengths = [len(ids) for ids in self.pipe.tokenizer(texts)["input_ids"]]
+        out: List[list] = [None] * len(texts)
+
+        def run(batch: List[int]):
+            results = self.pipe([texts[i] for i in batch], batch_size=len(batch))
+            for i, r in zip(batch, results):
+                out[i] = r
 
-            for label, score in best.items():
-                tags.append(PIIType(entity_type=label, score=score, box_index=i))
-        return tags
+        batch: List[int] = []
+        for i in sorted(range(len(texts)), key=lambda i: lengths[i]):
+            # In length order, text i is the longest of its batch and sets the padded width
+            if batch and (len(batch) + 1) * lengths[i] > self.token_budget:
+                run(batch)
+                batch = []
+            batch.append(i)
+        run(batch)
+        return out
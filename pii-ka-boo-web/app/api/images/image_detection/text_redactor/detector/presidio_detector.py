@@ -1,5 +1,6 @@
-from typing import List, Iterable
+from typing import Dict, List, Iterable, Tuple
 from core.types import BBox, PIIType
+from text_redactor.detector.text_blocks import text_blocks, has_word_chars
 
 from presidio_analyzer import AnalyzerEngine
 from presidio_analyzer.nlp_engine import NlpEngineProvider
@@ -21,13 +22,24 @@ class PresidioDetector:
         self.target = set(target_entities or ["PERSON","EMAIL_ADDRESS","PHONE_NUMBER","CREDIT_CARD", "IP_ADDRESS","LOCATION"])
         self.min_confidence_score = float(min_confidence_score)
 
+    def detect_batch(self, ocrs: List[List[BBox]]) -> List[List[PIIType]]:
+        return [self.detect(ocr) for ocr in ocrs]
+
     def detect(self, ocr: List[BBox]) -> List[PIIType]:
-        tags: List[PIIType] = []
-        for i, box in enumerate(ocr):
-            if not box.text.strip():
-                continue
-            results = self.analyzer.analyze(text=box.text, language=self.language)
+        """
+        Analyze the boxes block by block, in reading order.
+
+        Each block of lines is one analyzer call, so entities split across
+        boxes (a first and last name) are still found, and every box an
+        entity overlaps gets its tag. Boxes that are empty or only
+        punctuation are left out, as for PiiranhaDetector.
+        """
+        best: Dict[Tuple[int, str], float] = {}
+        for block in text_blocks(ocr, keep=has_word_chars):
+            results = self.analyzer.analyze(text=block.text, language=self.language)
             for r in results:
-                if r.entity_type in self.target and r.score >= self.min_confidence_score:   
-                    tags.append(PIIType(entity_type=r.entity_type, score=float(r.score), box_index=i))
-        return tags
+                if r.entity_type in self.target and r.score >= self.min_confidence_score:
+                    for i in block.boxes_in(r.start, r.end):
+                        key = (i, r.entity_type)
+                        best[key] = max(best.get(key, 0.0), float(r.score))
+        return [PIIType(entity_type=label, score=score, box_index=i) for (i, label), score in sorted(best.items())]
@@ -0,0 +1,81 @@
+from dataclasses import dataclass, field
+from typing import Callable, Dict, List, Tuple
+
+from core.types import BBox, Mask
+
+@dataclass
+class TextBlock:
+    """OCR boxes joined into one string, with the character span each box occupies."""
+    text: str = ""
+    # (start, end, box index) for every box in the block, in text order
+    spans: List[Tuple[int, int, int]] = field(default_factory=list)
+
+    def boxes_in(self, start: int, end: int) -> List[int]:
+        """Indices of the boxes that overlap text[start:end]."""
+        return [i for s, e, i in self.spans if s < end and start < e]
+
+def has_word_chars(text: str) -> bool:
+    """True unless text is empty or only punctuation and whitespace."""
+    return any(c.isalnum() for c in text)
+
+def reading_order_lines(ocr: List[BBox], keep: Callable[[str], bool] = None) -> List[List[int]]:
+    """
+    Group box indices into lines, top to bottom and left to right.
+
+    A box joins a line when its vertical centre is within half a line
+    height of the line's centre. Boxes without text, or whose text keep
+    rejects, are left out.
+    """
+    items = []
+    for i, box in enumerate(ocr):
+        text = (box.text or "").strip()
+        if not text or (keep is not None and not keep(text)):
+            continue
+        m = Mask.from_polygon(box.bbox)
+        items.append((m.y + m.h / 2, max(1, m.h), m.x, i))
+    items.sort()
+
+    lines: List[List[Tuple[float, int]]] = []
+    centres: List[Tuple[float, int]] = []
+    for cy, h, x, i in items:
+        if lines:
+            line_cy, line_h = centres[-1]
+            if abs(cy - line_cy) <= 0.5 * max(h, line_h):
+                lines[-1].append((x, i))
+                n = len(lines[-1])
+                centres[-1] = (line_cy + (cy - line_cy) / n, max(h, line_h))
+                continue
+        lines.append([(x, i)])
+        centres.append((cy, h))
+    return [[i for _, i in sorted(line)] for line in lines]
+
+def text_blocks(ocr: List[BBox], max_chars: int = 1000, keep: Callable[[str], bool] = None) -> List[TextBlock]:
+    """
+    Join the boxes of an image into blocks of reading-order text.
+
+    Boxes on a line are joined by spaces and lines by newlines. A new block
+    starts after a vertical gap taller than the line above it, or when
+    the block would grow past max_chars, so each block fits in one
+    detector call.
+    """
+    blocks: List[TextBlock] = []
+    block, bottom = None, None
+    for line in reading_order_lines(ocr, keep):
+        masks: Dict[int, Mask] = {i: Mask.from_polygon(ocr[i].bbox) for i in line}
+        top = min(m.y for m in masks.values())
+        height = max(m.h for m in masks.values())
+        length = sum(len(ocr[i].text.strip()) + 1 for i in line)
+        if block is None or top - bottom > height or len(block.text) + length > max_chars:
+            block = TextBlock()
+            blocks.append(block)
+        elif block.text:
+            block.text += "\n"
+
+        for k, i in enumerate(line):
+            if k:
+                block.text += " "
+            start = len(block.text)
+            block.text += ocr[i].text.strip()
+            block.spans.append((start, len(block.text), i))
+        bottom = max(m.y + m.h for m in masks.values())
+    return blocks
@@ -1,20 +1,192 @@
-from typing import List, Tuple
+from typing import Dict, List, Tuple, Union
 import numpy as np
 import cv2
 import easyocr
 
 from core.types import BBox
+from text_redactor.ocr.ocr_cache import OcrCache
 
 class EasyOCREngine:
 
-    def __init__(self, langs = None, detail: int = 1):
+    def __init__(self, langs = None, detail: int = 1, batch_size: int = 4, recog_batch_size: int = 16,
+                 workers: int = 0, bucket: int = 128, max_detect_pixels: int = 0, min_text_height: int = 16,
+                 cache: OcrCache = None):
 
         self.easyocr = easyocr
         self.reader = easyocr.Reader(langs, gpu = False)
         self.detail = detail
+        # Images per detection pass, text crops per recognition pass,
+        # dataloader workers for recognition, and the size step images
+        # are padded up to so similar sizes share a detection pass
+        self.batch_size = max(1, int(batch_size))
+        self.recog_batch_size = max(1, int(recog_batch_size))
+        self.workers = int(workers)
+        self.bucket = max(1, int(bucket))
+        # Detection runs on a copy scaled down to at most max_detect_pixels
+        # (0 keeps full resolution), unless the text found there is shorter
+        # than min_text_height pixels
+        self.max_detect_pixels = int(max_detect_pixels)
+        self.min_text_height = int(min_text_height)
+        # Results of images seen before, keyed by content and these settings
+        self.cache = cache
+        self.cache_settings = {"langs": list(langs or []), "detail": detail,
+                               "max_detect_pixels": self.max_detect_pixels, "min_text_height": self.min_text_height}
 
-    def extract(self, image_path: str) -> List[BBox]:
-        results = self.reader.readtext(image_path, detail = self.detail)
+    def extract(self, image: Union[str, np.ndarray]) -> List[BBox]:
+        """OCR an image given as a file path or an already decoded BGR array."""
+        if isinstance(image, str):
+            img = cv2.imread(image)
+            if img is None:
+                raise FileNotFoundError(f"Could not read image: {image}")
+            image = img
+        return self.extract_array(image)
+
+    def extract_array(self, img: np.ndarray) -> List[BBox]:
+        """
+        OCR a decoded BGR image without going back to disk.
+
+        Does what reader.readtext does after loading a file: CRAFT detection
+        on the RGB image, recognition on the greyscale one.
+        """
+        return self.extract_batch([img])[0]
+
+    def extract_batch(self, images: List[Union[str, np.ndarray]]) -> List[List[BBox]]:
+        """
+        OCR many images, returning one BBox list per image in input order.
+
+        Detection runs at detection_scale() of each image. Scaled images are
+        grouped by size, each rounded up to a multiple of self.bucket, and
+        padded at the right and bottom to their group's size, so up to
+        self.batch_size of them go through CRAFT detection in one forward
+        pass. An image whose detected text comes out shorter than
+        self.min_text_height is detected again at a larger scale. Boxes are
+        mapped back to full-resolution coordinates and recognised on the
+        full-resolution greyscale image. Images found in self.cache skip
+        all of this.
+        """
+        arrays = []
+        for image in images:
+            if isinstance(image, str):
+                img = cv2.imread(image)
+                if img is None:
+                    raise FileNotFoundError(f"Could not read image: {image}")
+                image = img
+            arrays.append(image)
+
+        results: List[List[BBox]] = [None] * len(arrays)
+        if self.cache is not None:
+            for i, img in enumerate(arrays):
+                results[i] = self.cache.get(img, self.cache_settings)
+        todo = [i for i, found in enumerate(results) if found is None]
+        for i, boxes in zip(todo, self._extract_uncached([arrays[i] for i in todo])):
+            results[i] = boxes
+            if self.cache is not None:
+                self.cache.put(arrays[i], self.cache_settings, boxes)
+        return results
+
+    def _extract_uncached(self, arrays: List[np.ndarray]) -> List[List[BBox]]:
+        if not arrays:
+            return []
+        inputs = [self._reader_inputs(img) for img in arrays]
+        rgbs = [rgb for rgb, _ in inputs]
+        scales = [self.detection_scale(*rgb.shape[:2]) for rgb in rgbs]
+        detected = self._detect(rgbs, scales)
+
+        retry = {}
+        for i, (horizontal, free) in enumerate(detected):
+            scale = self._refined_scale(horizontal, free, scales[i])
+            if scale != scales[i]:
+                retry[i] = scale
+        if retry:
+            redone = self._detect([rgbs[i] for i in retry], list(retry.values()))
+            for i, found in zip(retry, redone):
+                detected[i] = found
+
+        results: List[List[BBox]] = []
+        for (_, grey), (horizontal, free) in zip(inputs, detected):
+            found = self.reader.recognize(grey, horizontal, free, detail = self.detail,
+                                          batch_size = self.recog_batch_size, workers = self.workers)
+            results.append(self._to_boxes(found))
+        return results
+
+    def detection_scale(self, height: int, width: int) -> float:
+        """Scale factor (at most 1) that brings an image within max_detect_pixels."""
+        if self.max_detect_pixels <= 0 or height * width <= self.max_detect_pixels:
+            return 1.0
+        return (self.max_detect_pixels / (height * width)) ** 0.5
+
+    def _refined_scale(self, horizontal, free, scale: float) -> float:
+        """A larger scale if the median detected text height at scale is below min_text_height."""
+        if scale >= 1.0:
+            return scale
+        heights = [y_max - y_min for _, _, y_min, y_max in horizontal]
+        heights += [max(y for _, y in poly) - min(y for _, y in poly) for poly in free]
+        if not heights:
+            return scale
+        # Heights are in full-resolution pixels; this is what they were when detected
+        detected_height = float(np.median(heights)) * scale
+        if detected_height >= self.min_text_height:
+            return scale
+        return min(1.0, scale * self.min_text_height / max(detected_height, 1.0))
+
+    def _detect(self, rgbs: List[np.ndarray], scales: List[float]):
+        """Detect text in each image at its scale, returning (horizontal, free) lists in full-resolution coordinates."""
+        scaled = []
+        for rgb, scale in zip(rgbs, scales):
+            if scale < 1.0:
+                h, w = rgb.shape[:2]
+                rgb = cv2.resize(rgb, (max(1, round(w * scale)), max(1, round(h * scale))),
+                                 interpolation = cv2.INTER_AREA)
+            scaled.append(rgb)
+
+        buckets: Dict[Tuple[int, int], List[int]] = {}
+        for i, rgb in enumerate(scaled):
+            h, w = rgb.shape[:2]
+            key = (-(-h // self.bucket) * self.bucket, -(-w // self.bucket) * self.bucket)
+            buckets.setdefault(key, []).append(i)
+
+        detected = [None] * len(rgbs)
+        for (bh, bw), indices in buckets.items():
+            for start in range(0, len(indices), self.batch_size):
+                group = indices[start:start + self.batch_size]
+                if len(group) == 1:
+                    # Nothing to share a pass with, so skip the padding
+                    horizontal_lists, free_lists = self.reader.detect(scaled[group[0]])
+                else:
+                    batch = np.zeros((len(group), bh, bw, 3), dtype=np.uint8)
+                    for k, i in enumerate(group):
+                        batch[k, :scaled[i].shape[0], :scaled[i].shape[1]] = scaled[i]
+                    horizontal_lists, free_lists = self.reader.detect(batch, reformat = False)
+                for k, i in enumerate(group):
+                    h, w = rgbs[i].shape[:2]
+                    detected[i] = self._to_full_resolution(horizontal_lists[k], free_lists[k], scales[i], w, h)
+        return detected
+
+    @staticmethod
+    def _to_full_resolution(horizontal, free, scale: float, width: int, height: int):
+        """Undo the detection scale and clip boxes to the image; padding left the origin in place."""
+        rects = []
+        for x_min, x_max, y_min, y_max in horizontal:
+            x_min, x_max = max(0, int(x_min / scale)), min(width, int(np.ceil(x_max / scale)))
+            y_min, y_max = max(0, int(y_min / scale)), min(height, int(np.ceil(y_max / scale)))
+            if x_min < x_max and y_min < y_max:
+                rects.append([x_min, x_max, y_min, y_max])
+        polys = [
+            [[min(max(int(round(x / scale)), 0), width), min(max(int(round(y / scale)), 0), height)] for x, y in poly]
+            for poly in free
+        ]
+        return rects, polys
+
+    @staticmethod
+    def _reader_inputs(img: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        if img.ndim == 2:
+            return cv2.cvtColor(img, cv2.COLOR_GRAY2RGB), img
+        if img.shape[2] == 4:
+            img = cv2.cvtColor(img, cv2.COLOR_BGRA2BGR)
+        return cv2.cvtColor(img, cv2.COLOR_BGR2RGB), cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
+
+    @staticmethod
+    def _to_boxes(results) -> List[BBox]:
         ocr_boxes: List[BBox] = []
         for item in results:
             try:
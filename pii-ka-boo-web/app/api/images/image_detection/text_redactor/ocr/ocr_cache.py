@@ -0,0 +1,162 @@
+"""
+Content-addressed cache of OCR results.
+
+Entries are keyed by a hash of the decoded pixels and the OCR settings that
+change the output, and hold the BBox list for the image. A bounded
+in-memory LRU sits in front of an optional SQLite file whose total size is
+capped, evicting the least recently used entries first. Each entry also
+records a 64-bit difference hash of the image, so a recompressed or resized
+copy of a cached image can reuse its boxes, scaled to the new size.
+"""
+import hashlib
+import json
+import os
+import sqlite3
+import time
+import zlib
+from collections import OrderedDict
+from typing import List, Optional, Tuple
+
+import cv2
+import numpy as np
+
+from core.types import BBox
+
+def image_key(img: np.ndarray, settings: dict) -> str:
+    """Hash the pixels of a decoded image together with the OCR settings."""
+    h = hashlib.sha256()
+    h.update(json.dumps(settings, sort_keys=True).encode("utf-8"))
+    h.update(f"{img.shape}{img.dtype}".encode("utf-8"))
+    h.update(np.ascontiguousarray(img).data)
+    return h.hexdigest()
+
+def difference_hash(img: np.ndarray) -> int:
+    """64-bit dHash: whether each pixel of a 9x8 greyscale thumbnail is brighter than its right neighbour."""
+    grey = img if img.ndim == 2 else cv2.cvtColor(img[..., :3], cv2.COLOR_BGR2GRAY)
+    small = cv2.resize(grey, (9, 8), interpolation=cv2.INTER_AREA).astype(np.int16)
+    bits = (small[:, 1:] > small[:, :-1]).flatten()
+    return int(sum(1 << i for i, bit in enumerate(bits) if bit))
+
+def _pack(boxes: List[BBox]) -> bytes:
+    rows = [[b.text, round(b.confidence, 4), [c for point in b.bbox for c in point]] for b in boxes]
+    return zlib.compress(json.dumps(rows, separators=(",", ":")).encode("utf-8"))
+
+def _unpack(blob: bytes, sx: float = 1.0, sy: float = 1.0) -> List[BBox]:
+    boxes = []
+    for text, conf, coords in json.loads(zlib.decompress(blob)):
+        points = [(int(round(x * sx)), int(round(y * sy))) for x, y in zip(coords[::2], coords[1::2])]
+        boxes.append(BBox(text=text, bbox=points, confidence=conf))
+    return boxes
+
+class OcrCache:
+
+    def __init__(self, max_entries: int = 256, disk_path: str = None, max_disk_bytes: int = 64 * 1024 * 1024,
+                 max_phash_distance: int = 0):
+        self.max_entries = int(max_entries)
+        self.max_disk_bytes = int(max_disk_bytes)
+        # Largest dHash Hamming distance treated as the same picture; 0 turns near-duplicate reuse off
+        self.max_phash_distance = int(max_phash_distance)
+        # key -> (blob, width, height, dhash, settings)
+        self.memory = OrderedDict()
+        self.stats = {"hits": 0, "disk_hits": 0, "near_hits": 0, "misses": 0, "evictions": 0, "disk_evictions": 0}
+
+        self.db = None
+        if disk_path:
+            os.makedirs(os.path.dirname(os.path.abspath(disk_path)), exist_ok=True)
+            self.db = sqlite3.connect(disk_path, timeout=10, isolation_level=None)
+            self.db.execute("PRAGMA journal_mode=WAL")
+            self.db.execute(
+                "CREATE TABLE IF NOT EXISTS ocr (key TEXT PRIMARY KEY, settings TEXT, boxes BLOB, "
+                "width INTEGER, height INTEGER, dhash INTEGER, size INTEGER, used REAL)")
+            self.db.execute("CREATE INDEX IF NOT EXISTS ocr_used ON ocr (used)")
+
+    def get(self, img: np.ndarray, settings: dict) -> Optional[List[BBox]]:
+        """Return cached boxes for img, in its own coordinates, or None."""
+        key = image_key(img, settings)
+        entry = self.memory.get(key)
+        if entry is not None:
+            self.memory.move_to_end(key)
+            self.stats["hits"] += 1
+            return _unpack(entry[0])
+
+        if self.db is not None:
+            found = self.db.execute(
+                "SELECT boxes, width, height, dhash, settings FROM ocr WHERE key = ?", (key,)).fetchone()
+            if found is not None:
+                self.db.execute("UPDATE ocr SET used = ? WHERE key = ?", (time.time(), key))
+                self._remember(key, tuple(found))
+                self.stats["disk_hits"] += 1
+                return _unpack(found[0])
+
+        if self.max_phash_distance > 0:
+            near = self._nearest(img, settings)
+            if near is not None:
+                self.stats["near_hits"] += 1
+                return near
+
+        self.stats["misses"] += 1
+        return None
+
+    def put(self, img: np.ndarray, settings: dict, boxes: List[BBox]) -> None:
+        key = image_key(img, settings)
+        h, w = img.shape[:2]
+        # SQLite integers are signed 64-bit, so store the hash shifted into that range
+        dhash = difference_hash(img) - (1 << 63)
+        blob, settings_json = _pack(boxes), json.dumps(settings, sort_keys=True)
+        self._remember(key, (blob, w, h, dhash, settings_json))
+        if self.db is not None:
+            self.db.execute("INSERT OR REPLACE INTO ocr VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                            (key, settings_json, blob, w, h, dhash, len(blob), time.time()))
+            self._trim_disk()
+
+    def _nearest(self, img: np.ndarray, settings: dict) -> Optional[List[BBox]]:
+        """Boxes of the closest cached image by dHash, scaled to img, if within max_phash_distance."""
+        target = difference_hash(img) - (1 << 63)
+        settings_json = json.dumps(settings, sort_keys=True)
+        h, w = img.shape[:2]
+        candidates: List[Tuple[bytes, int, int, int]] = [
+            entry[:4] for entry in self.memory.values() if entry[4] == settings_json]
+        if self.db is not None:
+            candidates += self.db.execute(
+                "SELECT boxes, width, height, dhash FROM ocr WHERE settings = ?", (settings_json,)).fetchall()
+        best, best_distance = None, self.max_phash_distance + 1
+        for blob, cw, ch, dhash in candidates:
+            # Only reuse boxes from an image of the same shape, however it was scaled
+            if abs(cw * h - ch * w) > 0.01 * cw * h:
+                continue
+            distance = bin((dhash ^ target) & ((1 << 64) - 1)).count("1")
+            if distance < best_distance:
+                best, best_distance = (blob, cw, ch), distance
+        if best is None:
+            return None
+        blob, cw, ch = best
+        return _unpack(blob, w / cw, h / ch)
+
+    def _remember(self, key, entry):
+        if self.max_entries <= 0:
+            return
+        self.memory[key] = entry
+        self.memory.move_to_end(key)
+        while len(self.memory) > self.max_entries:
+            self.memory.popitem(last=False)
+            self.stats["evictions"] += 1
+
+    def _trim_disk(self):
+        total = self.db.execute("SELECT COALESCE(SUM(size), 0) FROM ocr").fetchone()[0]
+        while total > self.max_disk_bytes:
+            row = self.db.execute("SELECT key, size FROM ocr ORDER BY used LIMIT 1").fetchone()
+            if row is None:
+                break
+            self.db.execute("DELETE FROM ocr WHERE key = ?", (row[0],))
+            total -= row[1]
+            self.stats["disk_evictions"] += 1
+
+    def snapshot(self):
+        """Counters, hit rate and current sizes, for reporting."""
+        out = dict(self.stats, entries=len(self.memory))
+        lookups = sum(self.stats[k] for k in ("hits", "disk_hits", "near_hits", "misses"))
+        out["hit_rate"] = round((lookups - self.stats["misses"]) / lookups, 4) if lookups else 0.0
+        if self.db is not None:
+            out["disk_entries"], out["disk_bytes"] = self.db.execute(
+                "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM ocr").fetchone()
+        return out
@@ -8,15 +8,28 @@ import numpy as np
 
 from core.types import BBox, PIIType, Mask
 from text_redactor.ocr.easyocr_engine import EasyOCREngine
+from text_redactor.ocr.ocr_cache import OcrCache
 from text_redactor.detector.presidio_detector import PresidioDetector
 from text_redactor.detector.piiranha_detector import PiiranhaDetector
 from core.apply_blur import apply_gaussian_blur, apply_mosaic_blur
+from text_redactor.pii_blur.tiled import (open_image_memmap, new_scratch_path, copy_to_memmap,
+                                          tile_grid, offset_box, dedupe_seam_boxes)
 
 @dataclass
 class PipelineConfig:
     ocr_engine: str = "easyocr"
     ocr_langs: List[str] = None
     ocr_detail: int = 1
+    ocr_batch_size: int = 4
+    ocr_recog_batch_size: int = 16
+    ocr_workers: int = 0
+    ocr_bucket: int = 128
+    ocr_max_detect_pixels: int = 0
+    ocr_min_text_height: int = 16
+    ocr_cache_size: int = 256
+    ocr_cache_path: str = None
+    ocr_cache_max_bytes: int = 64 * 1024 * 1024
+    ocr_cache_phash_distance: int = 0
 
     presidio_language: str = "en"
     presidio_target_entities: List[str] = None
@@ -25,10 +38,14 @@ class PipelineConfig:
     piiranha_model_name: str = "iiiorg/piiranha-v1-detect-personal-information"
     piiranha_target_entities: List[str] = None
     piiranha_min_score: float = 0.5
+    piiranha_token_budget: int = 4096
 
     min_ocr_confidence: float = 0.3
     blur_method: str = "gaussian"   # gaussian | mosaic
     blur_strength: int = 31
+
+    tile_size: int = 2048
+    tile_overlap: int = 256
     
     @classmethod
     def from_json(cls, path: str) -> "PipelineConfig":
@@ -41,6 +58,16 @@ class PipelineConfig:
             ocr_engine=cfg.get("ocr", {}).get("engine", "easyocr"),
             ocr_langs=cfg.get("ocr", {}).get("langs", ["en"]),
             ocr_detail=int(cfg.get("ocr", {}).get("detail", 1)),
+            ocr_batch_size=int(cfg.get("ocr", {}).get("batch_size", 4)),
+            ocr_recog_batch_size=int(cfg.get("ocr", {}).get("recog_batch_size", 16)),
+            ocr_workers=int(cfg.get("ocr", {}).get("workers", 0)),
+            ocr_bucket=int(cfg.get("ocr", {}).get("bucket", 128)),
+            ocr_max_detect_pixels=int(cfg.get("ocr", {}).get("max_detect_pixels", 0)),
+            ocr_min_text_height=int(cfg.get("ocr", {}).get("min_text_height", 16)),
+            ocr_cache_size=int(cfg.get("ocr", {}).get("cache", {}).get("size", 256)),
+            ocr_cache_path=cfg.get("ocr", {}).get("cache", {}).get("path") or None,
+            ocr_cache_max_bytes=int(cfg.get("ocr", {}).get("cache", {}).get("max_bytes", 64 * 1024 * 1024)),
+            ocr_cache_phash_distance=int(cfg.get("ocr", {}).get("cache", {}).get("phash_distance", 0)),
 
             presidio_language = pii_presidio.get("language", "en"),
             presidio_target_entities = pii_presidio.get("target_entities", []),
@@ -49,21 +76,35 @@ class PipelineConfig:
             piiranha_model_name = pii_piiranha.get("model_name", "iiiorg/piiranha-v1-detect-personal-information"),
             piiranha_target_entities = pii_piiranha.get("target_entities", []),
             piiranha_min_score = float(pii_piiranha.get("min_score", 0.5)),
+            piiranha_token_budget = int(pii_piiranha.get("token_budget", 4096)),
 
             min_ocr_confidence=float(cfg.get("min_ocr_confidence", 0.3)),
             blur_method=cfg.get("blur", {}).get("method", "gaussian"),
             blur_strength=int(cfg.get("blur", {}).get("strength", 31)),
+
+            tile_size=int(cfg.get("tiling", {}).get("tile_size", 2048)),
+            tile_overlap=int(cfg.get("tiling", {}).get("overlap", 256)),
         )
 
 class PIIBlurPipeline:
     def __init__(self, config: PipelineConfig):
         self.cfg = config
-        self.ocr = EasyOCREngine(langs=self.cfg.ocr_langs, detail=self.cfg.ocr_detail)
+        self.ocr_cache = None
+        if self.cfg.ocr_cache_size > 0 or self.cfg.ocr_cache_path:
+            self.ocr_cache = OcrCache(max_entries=self.cfg.ocr_cache_size, disk_path=self.cfg.ocr_cache_path,
+                                      max_disk_bytes=self.cfg.ocr_cache_max_bytes,
+                                      max_phash_distance=self.cfg.ocr_cache_phash_distance)
+        self.ocr = EasyOCREngine(langs=self.cfg.ocr_langs, detail=self.cfg.ocr_detail,
+                                 batch_size=self.cfg.ocr_batch_size, recog_batch_size=self.cfg.ocr_recog_batch_size,
+                                 workers=self.cfg.ocr_workers, bucket=self.cfg.ocr_bucket,
+                                 max_detect_pixels=self.cfg.ocr_max_detect_pixels,
+                                 min_text_height=self.cfg.ocr_min_text_height, cache=self.ocr_cache)
 
 
         self.detector = [
             PresidioDetector(language=self.cfg.presidio_language, target_entities=self.cfg.presidio_target_entities, min_confidence_score=self.cfg.presidio_min_score),
-            PiiranhaDetector(self.cfg.piiranha_model_name, target_entities=self.cfg.piiranha_target_entities, min_confidence_score=self.cfg.piiranha_min_score)
+            PiiranhaDetector(self.cfg.piiranha_model_name, target_entities=self.cfg.piiranha_target_entities, min_confidence_score=self.cfg.piiranha_min_score,
+                             token_budget=self.cfg.piiranha_token_budget)
         ]
 
     def _mask_from_BBox(self, box: BBox, width: int, height: int) -> Mask:
@@ -80,22 +121,97 @@ class PIIBlurPipeline:
         img = cv2.imread(image_path)
         if img is None:
             raise FileNotFoundError(f"Could not read image: {image_path}")
-        h, w = img.shape[:2]
+        result = self.process_array(img)
+        result["path"] = image_path
+        return result
+
+    def process_bytes(self, data: bytes, ext: str = ".png") -> Dict[str, Any]:
+        """
+        Redact an encoded image held in memory.
+
+        The image is decoded once, redacted with process_array() and
+        encoded again in the format given by ext; nothing touches disk.
+        The result carries the encoded output under "bytes".
+        """
+        img = cv2.imdecode(np.frombuffer(data, dtype=np.uint8), cv2.IMREAD_COLOR)
+        if img is None:
+            raise ValueError("Could not decode image bytes")
+        result = self.process_array(img)
+        ok, encoded = cv2.imencode(ext, result["image"])
+        if not ok:
+            raise ValueError(f"Could not encode image as {ext}")
+        result["bytes"] = encoded.tobytes()
+        return result
+
+    def process_array(self, img: np.ndarray) -> Dict[str, Any]:
+        """Redact a decoded BGR image in place; OCR reads the same buffer that gets blurred."""
+        return self._redact(img, self.ocr.extract_array(img))
+
+    def process_arrays(self, imgs: List[np.ndarray]) -> List[Dict[str, Any]]:
+        """Redact several decoded images in place, running OCR and PII detection on them in batches."""
+        return self._redact_many(imgs, self.ocr.extract_batch(imgs))
+
+    def process_tiled(self, image_path: str, output_path: str, scratch_dir: str = None) -> Dict[str, Any]:
+        """
+        Redact an image too large to hold in memory, tile by tile.
+
+        The input is opened with open_image_memmap() and OCR runs on one
+        tile_size tile at a time, with tiles overlapping by tile_overlap so
+        text on a seam is whole in at least one of them; boxes found twice
+        are dropped by dedupe_seam_boxes(). Blurs are written into a
+        memmap-backed copy of the image. Apart from decoding formats that
+        cannot be mapped, peak memory depends on the tile size, not the
+        image size. Keep tile_overlap above the longest line of text.
+
+        An output_path ending in .npy keeps the result as the memmap itself;
+        any other extension is encoded with cv2.imwrite.
+        """
+        src, scratch_in = open_image_memmap(image_path, scratch_dir)
+        to_npy = output_path.lower().endswith(".npy")
+        out_path = output_path if to_npy else new_scratch_path(scratch_dir)
+        try:
+            h, w = src.shape[:2]
+            found = []
+            for index, (x, y, tw, th) in enumerate(tile_grid(h, w, self.cfg.tile_size, self.cfg.tile_overlap)):
+                tile = np.ascontiguousarray(src[y:y + th, x:x + tw])
+                found += [(index, offset_box(b, x, y)) for b in self.ocr.extract_array(tile)]
+            ocr_boxes = dedupe_seam_boxes(found)
+
+            out = copy_to_memmap(src, out_path)
+            result = self._redact(out, ocr_boxes)
+            out.flush()
+            if not to_npy:
+                cv2.imwrite(output_path, out)
+            del out
+        finally:
+            del src
+            for path in (scratch_in, None if to_npy else out_path):
+                if path and os.path.exists(path):
+                    os.remove(path)
+
+        result.update({"path": image_path, "image": None, "output_path": output_path})
+        return result
+
+    def _redact(self, img: np.ndarray, ocr_boxes: List[BBox]) -> Dict[str, Any]:
+        return self._redact_many([img], [ocr_boxes])[0]
+
+    def _redact_many(self, imgs: List[np.ndarray], box_lists: List[List[BBox]]) -> List[Dict[str, Any]]:
+        box_lists = [[b for b in ocr_boxes if b.confidence is None or b.confidence >= self.cfg.min_ocr_confidence]
+                     for ocr_boxes in box_lists]
 
-        ocr_boxes: List[BBox] = self.ocr.extract(image_path)
-        ocr_boxes = [b for b in ocr_boxes if b.confidence is None or b.confidence >= self.cfg.min_ocr_confidence]
-        
         for detector in self.detector:
-            pii_tags: List[PIIType] = detector.detect(ocr_boxes)
+            tag_lists: List[List[PIIType]] = detector.detect_batch(box_lists)
 
-            for tag in pii_tags:
-                mask = self._mask_from_BBox(ocr_boxes[tag.box_index], w, h)
-                self._apply_blur(img, mask)
+            for img, ocr_boxes, pii_tags in zip(imgs, box_lists, tag_lists):
+                h, w = img.shape[:2]
+                for tag in pii_tags:
+                    mask = self._mask_from_BBox(ocr_boxes[tag.box_index], w, h)
+                    self._apply_blur(img, mask)
 
-        return {
-            "path": image_path,
+        return [{
+            "path": None,
             "image": img,
             "num_ocr_boxes": len(ocr_boxes),
             "num_pii_tags": len(pii_tags),
             "pii_tags": pii_tags,
-        }
+        } for img, ocr_boxes, pii_tags in zip(imgs, box_lists, tag_lists)]
@@ -0,0 +1,94 @@
+from typing import Iterator, List, Optional, Tuple
+import os
+import tempfile
+import cv2
+import numpy as np
+
+from core.types import BBox, Mask
+
+def open_image_memmap(path: str, scratch_dir: str = None) -> Tuple[np.ndarray, Optional[str]]:
+    """
+    Open an image as a read-only array backed by a file instead of RAM.
+
+    .npy files are mapped directly, and so are uncompressed TIFFs when the
+    optional tifffile package is installed. Other formats can only be
+    decoded in one go, so they are decoded once and spilled to a scratch
+    .npy that is mapped in their place; only that decode holds the whole
+    image in memory.
+
+    Returns:
+        (array, scratch path to delete when done, or None)
+    """
+    ext = os.path.splitext(path)[1].lower()
+    if ext == ".npy":
+        return np.load(path, mmap_mode="r"), None
+    if ext in {".tif", ".tiff"}:
+        try:
+            import tifffile
+            return tifffile.memmap(path, mode="r"), None
+        except (ImportError, ValueError):
+            pass
+
+    img = cv2.imread(path)
+    if img is None:
+        raise FileNotFoundError(f"Could not read image: {path}")
+    scratch = new_scratch_path(scratch_dir)
+    mapped = np.lib.format.open_memmap(scratch, mode="w+", dtype=img.dtype, shape=img.shape)
+    mapped[:] = img
+    mapped.flush()
+    del img, mapped
+    return np.load(scratch, mmap_mode="r"), scratch
+
+def new_scratch_path(scratch_dir: str = None) -> str:
+    fd, path = tempfile.mkstemp(suffix=".npy", dir=scratch_dir)
+    os.close(fd)
+    return path
+
+def copy_to_memmap(src: np.ndarray, path: str, rows: int = 1024) -> np.memmap:
+    """Copy src into a new writable .npy memmap at path, a band of rows at a time."""
+    out = np.lib.format.open_memmap(path, mode="w+", dtype=src.dtype, shape=src.shape)
+    for y in range(0, src.shape[0], rows):
+        out[y:y + rows] = src[y:y + rows]
+    return out
+
+def tile_grid(height: int, width: int, tile: int, overlap: int) -> Iterator[Tuple[int, int, int, int]]:
+    """Yield (x, y, w, h) of tiles of at most tile pixels that cover the image, each overlapping its neighbours by overlap."""
+    step = max(1, tile - overlap)
+    ys = list(range(0, max(1, height - overlap), step)) if height > tile else [0]
+    xs = list(range(0, max(1, width - overlap), step)) if width > tile else [0]
+    for y in ys:
+        for x in xs:
+            yield x, y, min(tile, width - x), min(tile, height - y)
+
+def offset_box(box: BBox, dx: int, dy: int) -> BBox:
+    return BBox(text=box.text, bbox=[(x + dx, y + dy) for x, y in box.bbox], confidence=box.confidence)
+
+def dedupe_seam_boxes(boxes: List[Tuple[int, BBox]], min_cover: float = 0.5) -> List[BBox]:
+    """
+    Drop boxes that a neighbouring tile found as well.
+
+    Text in the overlap between tiles is found by both. Boxes are taken
+    largest first, so a word cut off at one tile's edge loses to the whole
+    word from the next tile, and a box is dropped when at least min_cover
+    of its area lies inside a box already kept from a different tile.
+
+    Args:
+        boxes: (tile index, box in image coordinates) pairs
+    """
+    def area(m: Mask) -> int:
+        return m.w * m.h
+
+    def inter(a: Mask, b: Mask) -> int:
+        w = min(a.x + a.w, b.x + b.w) - max(a.x, b.x)
+        h = min(a.y + a.h, b.y + b.h) - max(a.y, b.y)
+        return max(0, w) * max(0, h)
+
+    masks = [(i, tile, Mask.from_polygon(box.bbox)) for i, (tile, box) in enumerate(boxes)]
+    masks.sort(key=lambda t: area(t[2]), reverse=True)
+    kept: List[Tuple[int, int, Mask]] = []
+    for i, tile, mask in masks:
+        if any(t != tile and inter(mask, m) >= min_cover * max(1, area(mask)) for _, t, m in kept):
+            continue
+        kept.append((i, tile, mask))
+    # Back in tile order, which is the order the OCR found them in
+    return [boxes[i][1] for i, _, _ in sorted(kept)]
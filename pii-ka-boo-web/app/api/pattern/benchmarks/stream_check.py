@@ -0,0 +1,44 @@
+"""
+Check that streaming replacement matches one replacement over the whole text.
+
+Each case is split into chunks of every size from 1 up to the text length,
+so every chunk boundary is tried, including ones inside a match. Cases
+include literals with a zero or low quantity, where the quantifier repeats
+only the last character. Exits 1 on any difference. Run from
+pii-ka-boo-web/:
+
+    python app/api/pattern/benchmarks/stream_check.py
+"""
+import os
+import sys
+
+# Add the parent directory to sys.path to import code.py
+parent_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, parent_dir)
+from code import replace_custom_pattern, replace_custom_pattern_stream
+
+CASES = [
+    ("xx ab yy abc zz abcc", [{"type": "literal", "value": "abc", "quantity": 0}]),
+    ("xx ab yy abc zz abcc", [{"type": "literal", "value": "abc", "quantity": "optional"}]),
+    ("id-7 id-77 id-777 id-", [{"type": "literal", "value": "id-"}, {"type": "digits", "quantity": (1, 2)}]),
+    ("key: ab12 and abc12", [{"type": "literal", "value": "abc", "quantity": (0, 1)}, {"type": "digits", "quantity": 2}]),
+    ("call 555-1234 or 555-12345", [{"type": "digits", "quantity": 3}, {"type": "literal", "value": "-"},
+                                    {"type": "digits", "quantity": 4}]),
+]
+
+def chunked(text, size):
+    return [text[i:i + size] for i in range(0, len(text), size)]
+
+def main():
+    failures = 0
+    for text, sequence in CASES:
+        expected = replace_custom_pattern(text, "[X]", sequence)
+        bad = [size for size in range(1, len(text) + 1)
+               if "".join(replace_custom_pattern_stream(chunked(text, size), "[X]", sequence)) != expected]
+        failures += bool(bad)
+        print(f"{'ok' if not bad else 'DIFFERENT':<10} {text!r} -> {expected!r}"
+              + (f" (chunk sizes {bad})" if bad else ""))
+    sys.exit(1 if failures else 0)
+
+if __name__ == "__main__":
+    main()
@@ -1,6 +1,62 @@
 import re
+import os
 import json
 import sys
+import time
+import signal
+import hashlib
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+from functools import lru_cache
+
+# Compiled patterns kept by a resident process (see serve())
+PATTERN_CACHE_SIZE = int(os.getenv("PII_PATTERN_CACHE_SIZE", 256))
+
+
+def pattern_key(pattern_sequence) -> str:
+    """Hash a pattern sequence independently of dict key order and tuple/list ranges."""
+    canonical = json.dumps(pattern_sequence, sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+
+class PatternRegistry:
+    """LRU cache of compiled regexes keyed by pattern_key()."""
+
+    def __init__(self, max_entries: int = PATTERN_CACHE_SIZE):
+        self.max_entries = int(max_entries)
+        self.patterns = OrderedDict()
+        self.stats = {"hits": 0, "misses": 0, "evictions": 0}
+
+    def get(self, pattern_sequence: list[dict]) -> re.Pattern:
+        """Return the compiled regex for pattern_sequence, building it on a miss."""
+        return self._lookup(pattern_key(pattern_sequence), compile_pattern, pattern_sequence)
+
+    def get_combined(self, pattern_sequences: list[list[dict]]) -> re.Pattern:
+        """Return the alternation of several pattern sequences, see compile_combined_pattern()."""
+        return self._lookup(pattern_key({"any": pattern_sequences}), compile_combined_pattern, pattern_sequences)
+
+    def _lookup(self, key, build, spec) -> re.Pattern:
+        compiled = self.patterns.get(key)
+        if compiled is not None:
+            self.patterns.move_to_end(key)
+            self.stats["hits"] += 1
+            return compiled
+
+        self.stats["misses"] += 1
+        compiled = build(spec)
+        if self.max_entries > 0:
+            self.patterns[key] = compiled
+            while len(self.patterns) > self.max_entries:
+                self.patterns.popitem(last=False)
+                self.stats["evictions"] += 1
+        return compiled
+
+    def snapshot(self) -> dict:
+        return {**self.stats, "entries": len(self.patterns)}
+
+
+registry = PatternRegistry()
 
 
 def replace_custom_pattern(
@@ -42,43 +98,70 @@ def replace_custom_pattern(
     Raises:
         ValueError: If no valid pattern can be formed from the provided inputs,
                     if 'n_char' is invalid, or if 'pattern_sequence' is malformed.
+
+    The compiled regex is kept in the module's PatternRegistry, so a
+    resident process (see serve()) builds each distinct sequence once.
+    Sequences are checked with check_backtracking() before they are
+    compiled, and matching stops with PatternTimeoutError after
+    PII_PATTERN_TIME_BUDGET_MS.
     """
-    final_regex_pattern = ""
+    # --- Perform Replacement ---
+    compiled = registry.get(pattern_sequence)
+    with time_budget():
+        return compiled.sub(replace_by, original_string)
+
+
+# Regex for one character of each non-literal component type
+CLASS_PATTERNS = {
+    'letters': '[a-zA-Z]',
+    'uppercase_letters': '[A-Z]',
+    'lowercase_letters': '[a-z]',
+    'digits': '\\d',
+    'any_char': '.',
+    'whitespace': '\\s',
+    'non_whitespace': '\\S',
+    'word_char': '\\w',
+    'non_word_char': '\\W',
+}
+
+# Characters read at a time, and the overlap kept between reads when a
+# pattern has no maximum match length, for the streaming replacements
+STREAM_CHUNK_CHARS = int(os.getenv("PII_PATTERN_STREAM_CHUNK_CHARS", 65536))
+STREAM_OVERLAP_CHARS = int(os.getenv("PII_PATTERN_STREAM_OVERLAP_CHARS", 4096))
+
+# Wall-clock budget for one replacement call; 0 disables it
+PATTERN_TIME_BUDGET_MS = float(os.getenv("PII_PATTERN_TIME_BUDGET_MS", 250))
+
+
+class UnsafePatternError(ValueError):
+    """A pattern sequence that can backtrack catastrophically."""
 
+
+class PatternTimeoutError(ValueError):
+    """Matching ran past the time budget."""
+
+
+def build_pattern(pattern_sequence: list[dict]) -> str:
+    """
+    Build the regex source for a pattern sequence, as described in replace_custom_pattern().
+
+    Raises:
+        ValueError: If the sequence is malformed or yields an empty pattern.
+    """
     # --- Build pattern from pattern_sequence ---
     regex_parts = []
-    for i, component in enumerate(pattern_sequence):
+    for component in pattern_sequence:
         comp_type = component.get('type')
         comp_value = component.get('value')
         comp_quantity = component.get('quantity', 1)  # Default quantity is 1
 
-        print(
-            f"DEBUG: Processing component {i}: type={comp_type}, value={comp_value}, quantity={comp_quantity} (type: {type(comp_quantity)})", file=sys.stderr)
-
-        regex_segment = ""
         if comp_type == 'literal':
             if comp_value is None:
                 raise ValueError(
                     "Pattern component of type 'literal' requires a 'value'.")
             regex_segment = re.escape((comp_value))
-        elif comp_type == 'letters':
-            regex_segment = '[a-zA-Z]'
-        elif comp_type == 'uppercase_letters':
-            regex_segment = '[A-Z]'
-        elif comp_type == 'lowercase_letters':
-            regex_segment = '[a-z]'
-        elif comp_type == 'digits':
-            regex_segment = '\\d'
-        elif comp_type == 'any_char':
-            regex_segment = '.'
-        elif comp_type == 'whitespace':
-            regex_segment = '\\s'
-        elif comp_type == 'non_whitespace':
-            regex_segment = '\\S'
-        elif comp_type == 'word_char':
-            regex_segment = '\\w'
-        elif comp_type == 'non_word_char':
-            regex_segment = '\\W'
+        elif comp_type in CLASS_PATTERNS:
+            regex_segment = CLASS_PATTERNS[comp_type]
         else:
             raise ValueError(f"Unknown pattern component type: '{comp_type}'")
 
@@ -89,7 +172,8 @@ def replace_custom_pattern(
                     f"Quantity for '{comp_type}' must be non-negative, got {comp_quantity}.")
             regex_segment += f"{{{comp_quantity}}}"
         # NEW: Handle (min, max) tuple
-        elif isinstance(comp_quantity, tuple) and len(comp_quantity) == 2:
+        # (min, max) arrives as a two-item list when it comes from JSON
+        elif isinstance(comp_quantity, (tuple, list)) and len(comp_quantity) == 2:
             min_c, max_c = comp_quantity
             if not (isinstance(min_c, int) and isinstance(max_c, int) and min_c >= 0 and max_c >= min_c):
                 raise ValueError(
@@ -114,22 +198,338 @@ def replace_custom_pattern(
 
     final_regex_pattern = "".join(regex_parts)
 
-    print(
-        f"DEBUG: Final regex pattern: {final_regex_pattern}", file=sys.stderr)
-
     if not final_regex_pattern:
         raise ValueError(
             "No pattern created: An unexpected condition resulted in an empty pattern. Please review your inputs.")
+    return final_regex_pattern
 
-    # --- Perform Replacement ---
+
+def quantity_bounds(quantity) -> tuple:
+    """(min, max) repetitions for a component quantity, max None when unbounded."""
+    if quantity == 'one_or_more':
+        return 1, None
+    if quantity == 'zero_or_more':
+        return 0, None
+    if quantity == 'optional':
+        return 0, 1
+    if isinstance(quantity, (tuple, list)):
+        return quantity[0], quantity[1]
+    return quantity, quantity
+
+
+@lru_cache(maxsize=None)
+def component_chars(comp_type: str, value: str = None) -> frozenset:
+    """Characters a component can match, sampled over the first 0x800 code points."""
+    if comp_type == 'literal':
+        return frozenset(value)
+    pattern = re.compile(CLASS_PATTERNS[comp_type])
+    return frozenset(c for c in map(chr, range(0x800)) if pattern.fullmatch(c))
+
+
+def merge_repeated_components(pattern_sequence: list[dict]) -> list[dict]:
+    """
+    Rewrite runs of adjacent components of the same non-literal type.
+
+    'digits' one_or_more followed by 'digits' one_or_more can split a run
+    of digits between them in many ways. It is rewritten to the equivalent
+    fixed 'digits' {2} followed by a single 'digits' zero_or_more, which can
+    only match one way.
+    """
+    merged = []
+    for component in pattern_sequence:
+        comp_type = component.get('type')
+        bounds = quantity_bounds(component.get('quantity', 1))
+        if merged and comp_type != 'literal' and merged[-1][0] == comp_type:
+            (lo, hi), (add_lo, add_hi) = merged[-1][1], bounds
+            merged[-1] = (comp_type, (lo + add_lo, None if hi is None or add_hi is None else hi + add_hi), None)
+        else:
+            merged.append((comp_type, bounds, component))
+
+    out = []
+    for comp_type, (lo, hi), original in merged:
+        if original is not None:
+            out.append(original)
+            continue
+        if lo:
+            out.append({'type': comp_type, 'quantity': lo})
+        if hi is None:
+            out.append({'type': comp_type, 'quantity': 'zero_or_more'})
+        elif hi > lo:
+            out.append({'type': comp_type, 'quantity': [0, hi - lo]})
+    return out
+
+
+def check_backtracking(pattern_sequence: list[dict]) -> list[dict]:
+    """
+    Make a pattern sequence safe to match, or reject it.
+
+    Adjacent components of the same type are merged first, see
+    merge_repeated_components(). The sequence is then rejected if two
+    unbounded components can match the same characters and everything
+    between them is optional or can match those characters too, like
+    'word_char' one_or_more followed by 'digits' one_or_more. The regex
+    engine would try every way of splitting such a run between them,
+    which on a long non-matching input takes time growing with a power
+    of its length.
+
+    Returns:
+        The sequence to build, possibly rewritten.
+
+    Raises:
+        UnsafePatternError: If the sequence is ambiguous in this way.
+    """
+    pattern_sequence = merge_repeated_components(pattern_sequence)
+    parts = [
+        (c.get('type'), quantity_bounds(c.get('quantity', 1)), component_chars(c.get('type'), c.get('value')))
+        for c in pattern_sequence
+    ]
+    for i, (type_i, (_, hi_i), chars_i) in enumerate(parts):
+        if hi_i is not None:
+            continue
+        for j in range(i + 1, len(parts)):
+            type_j, (lo_j, hi_j), chars_j = parts[j]
+            shared = chars_i & chars_j
+            if hi_j is None and shared:
+                raise UnsafePatternError(
+                    f"Components {i + 1} ('{type_i}') and {j + 1} ('{type_j}') are both unbounded and can "
+                    f"match the same characters, so matching can take very long on some inputs. "
+                    f"Separate them with a component neither can match, or bound one of them.")
+            if lo_j > 0 and not (chars_j & chars_i):
+                break
+    return pattern_sequence
+
+
+@contextmanager
+def time_budget(ms: float = PATTERN_TIME_BUDGET_MS):
+    """
+    Raise PatternTimeoutError if the enclosed block runs longer than ms.
+
+    Uses SIGALRM, which the regex engine checks while it backtracks, so it
+    only applies in the main thread of a Unix process. Elsewhere the block
+    runs unbounded.
+    """
+    if ms <= 0 or not hasattr(signal, "setitimer") or threading.current_thread() is not threading.main_thread():
+        yield
+        return
+
+    def expire(signum, frame):
+        raise PatternTimeoutError(f"Pattern matching took longer than {ms:g} ms and was stopped.")
+
+    previous = signal.signal(signal.SIGALRM, expire)
+    signal.setitimer(signal.ITIMER_REAL, ms / 1000)
+    try:
+        yield
+    finally:
+        signal.setitimer(signal.ITIMER_REAL, 0)
+        signal.signal(signal.SIGALRM, previous)
+
+
+def compile_pattern(pattern_sequence: list[dict]) -> re.Pattern:
+    """Build and compile the regex for a pattern sequence, after check_backtracking()."""
+    build_pattern(pattern_sequence)  # reject malformed sequences before analysing them
+    final_regex_pattern = build_pattern(check_backtracking(pattern_sequence))
+    try:
+        return re.compile(final_regex_pattern)
+    except re.error as e:
+        raise ValueError(
+            f"An internal error occurred with the generated pattern: '{final_regex_pattern}'. Error: {e}")
+
+
+def compile_combined_pattern(pattern_sequences: list[list[dict]]) -> re.Pattern:
+    """
+    Compile one alternation with a named group per pattern sequence.
+
+    Group "p<i>" holds the i-th sequence, so match.lastgroup tells which
+    one matched. At any position the earliest sequence in the list that
+    matches there wins.
+    """
+    parts = []
+    for i, pattern_sequence in enumerate(pattern_sequences):
+        build_pattern(pattern_sequence)
+        parts.append(f"(?P<p{i}>{build_pattern(check_backtracking(pattern_sequence))})")
+    final_regex_pattern = "|".join(parts)
     try:
-        result = re.sub(final_regex_pattern, replace_by, original_string)
-        return result
+        return re.compile(final_regex_pattern)
     except re.error as e:
         raise ValueError(
             f"An internal error occurred with the generated pattern: '{final_regex_pattern}'. Error: {e}")
 
 
+def required_literals(pattern_sequence: list[dict]) -> list[str]:
+    """Literal values that every match of the sequence must contain."""
+    literals = []
+    for component in pattern_sequence:
+        if component.get('type') != 'literal' or not component.get('value'):
+            continue
+        quantity = component.get('quantity', 1)
+        if isinstance(quantity, (tuple, list)):
+            quantity = quantity[0] if len(quantity) == 2 else 0
+        if quantity == 'one_or_more' or (isinstance(quantity, int) and quantity >= 1):
+            literals.append(component['value'])
+    return literals
+
+
+def replace_custom_patterns(original_string: str, patterns: list[dict]) -> str:
+    """
+    Apply several pattern sequences in a single scan of the string.
+
+    Matches are found left to right and do not overlap. When more than one
+    sequence matches at the same position, the one listed first wins, even
+    if a later one would match more text. Unlike calling
+    replace_custom_pattern() once per sequence, a replacement is never
+    matched again by a later sequence. Sequences with a required literal
+    that does not occur in the string are left out of the scan.
+
+    Args:
+        original_string (str): The text in which to perform the replacements.
+        patterns (list[dict]): Each item has a 'pattern_sequence', in the
+                               format taken by replace_custom_pattern(), and an
+                               optional 'replace_by' (default '[BLURRED]'),
+                               which is inserted as is.
+
+    Returns:
+        str: The string after performing the replacements.
+
+    Raises:
+        ValueError: If any pattern sequence is malformed.
+    """
+    candidates = [
+        p for p in patterns
+        if all(literal in original_string for literal in required_literals(p['pattern_sequence']))
+    ]
+    if not candidates:
+        return original_string
+
+    replacements = [p.get('replace_by', '[BLURRED]') for p in candidates]
+    combined = registry.get_combined([p['pattern_sequence'] for p in candidates])
+    with time_budget():
+        return combined.sub(lambda m: replacements[int(m.lastgroup[1:])], original_string)
+
+
+def max_match_length(pattern_sequence: list[dict]):
+    """Longest string the sequence can match, or None if it is unbounded."""
+    total = 0
+    for component in pattern_sequence:
+        _, hi = quantity_bounds(component.get('quantity', 1))
+        if hi is None:
+            return None
+        if component.get('type') == 'literal':
+            # The quantifier repeats only the last character of the literal
+            total += len(component['value']) - 1 + hi
+        else:
+            total += hi
+    return total
+
+
+def replace_stream(chunks, compiled: re.Pattern, repl, overlap: int):
+    """
+    Run compiled.sub(repl, ...) over text arriving in chunks, yielding output as it goes.
+
+    After each chunk, matches that start more than overlap characters
+    before the end of the text read so far are replaced and the text up to
+    there is yielded. The rest is kept for the next chunk. When overlap is
+    at least the longest possible match, those matches cannot change with
+    more input, so the output is the same as one sub() over the whole text.
+    At most overlap characters plus one chunk are held at a time.
+    """
+    carry = ""
+    for chunk in chunks:
+        buffer = carry + chunk
+        safe = len(buffer) - overlap
+        if safe <= 0:
+            carry = buffer
+            continue
+        out, pos = [], 0
+        with time_budget():
+            for m in compiled.finditer(buffer):
+                if m.start() >= safe:
+                    break
+                out.append(buffer[pos:m.start()])
+                out.append(repl(m) if callable(repl) else m.expand(repl))
+                pos = m.end()
+        if pos < safe:
+            out.append(buffer[pos:safe])
+            pos = safe
+        carry = buffer[pos:]
+        yield "".join(out)
+    with time_budget():
+        yield compiled.sub(repl, carry)
+
+
+def replace_custom_pattern_stream(chunks, replace_by: str, pattern_sequence: list[dict]):
+    """
+    Streaming replace_custom_pattern(): yield the replaced text chunk by chunk.
+
+    The overlap between chunks is the sequence's max_match_length(). For
+    sequences with an unbounded component it is PII_PATTERN_STREAM_OVERLAP_CHARS,
+    and a match longer than that may be cut where two chunks meet.
+
+    Args:
+        chunks: Iterable of strings, such as successive reads of a file
+        replace_by (str): The string to insert in place of the matched pattern.
+        pattern_sequence (list[dict]): As for replace_custom_pattern().
+    """
+    overlap = max_match_length(pattern_sequence)
+    compiled = registry.get(pattern_sequence)
+    yield from replace_stream(chunks, compiled, replace_by, STREAM_OVERLAP_CHARS if overlap is None else overlap)
+
+
+def replace_custom_patterns_stream(chunks, patterns: list[dict]):
+    """
+    Streaming replace_custom_patterns(): yield the replaced text chunk by chunk.
+
+    The overlap is the longest max_match_length() among the patterns, as
+    for replace_custom_pattern_stream(). The required-literal prefilter is
+    not used, since the whole text is never available at once.
+    """
+    lengths = [max_match_length(p['pattern_sequence']) for p in patterns]
+    overlap = STREAM_OVERLAP_CHARS if None in lengths else max(lengths, default=0)
+    replacements = [p.get('replace_by', '[BLURRED]') for p in patterns]
+    combined = registry.get_combined([p['pattern_sequence'] for p in patterns])
+    yield from replace_stream(chunks, combined, lambda m: replacements[int(m.lastgroup[1:])], overlap)
+
+
+def read_chunks(f, chunk_chars: int = STREAM_CHUNK_CHARS):
+    """Yield successive reads of chunk_chars characters from an open file."""
+    for chunk in iter(lambda: f.read(chunk_chars), ""):
+        yield chunk
+
+
+def stream_main(argv):
+    """Command line for the streaming replacements: files or stdin to stdout."""
+    import argparse
+
+    parser = argparse.ArgumentParser(prog="code.py --stream",
+                                     description="Replace custom patterns in files or stdin, writing to stdout.")
+    parser.add_argument("files", nargs="*", help="Input files (default: stdin)")
+    group = parser.add_mutually_exclusive_group(required=True)
+    group.add_argument("--pattern", help="JSON pattern_sequence")
+    group.add_argument("--patterns", help="JSON list of {pattern_sequence, replace_by}")
+    parser.add_argument("--replace-by", default="[BLURRED]", help="Replacement for --pattern")
+    parser.add_argument("--chunk-chars", type=int, default=STREAM_CHUNK_CHARS)
+    args = parser.parse_args(argv)
+
+    # Pass undecodable bytes through unchanged rather than failing mid-file
+    sys.stdout.reconfigure(encoding="utf-8", errors="surrogateescape")
+    if args.files:
+        def chunks():
+            for path in args.files:
+                with open(path, encoding="utf-8", errors="surrogateescape", newline="") as f:
+                    yield from read_chunks(f, args.chunk_chars)
+        source = chunks()
+    else:
+        sys.stdin.reconfigure(encoding="utf-8", errors="surrogateescape", newline="")
+        source = read_chunks(sys.stdin, args.chunk_chars)
+
+    if args.patterns:
+        output = replace_custom_patterns_stream(source, json.loads(args.patterns))
+    else:
+        output = replace_custom_pattern_stream(source, args.replace_by, json.loads(args.pattern))
+    for out in output:
+        sys.stdout.write(out)
+        sys.stdout.flush()
+
+
 def get_component_type() -> str:
     """Prompts the user to select a component type."""
     type_options = {
@@ -262,12 +662,6 @@ def process_api_request():
         pattern_sequence = input_data.get('pattern_sequence', [])
         replace_by = input_data.get('replace_by', '[BLURRED]')
 
-        # Debug logging
-        print(f"DEBUG: Received text: {text}", file=sys.stderr)
-        print(
-            f"DEBUG: Received pattern_sequence: {pattern_sequence}", file=sys.stderr)
-        print(f"DEBUG: Received replace_by: {replace_by}", file=sys.stderr)
-
         if not text or not pattern_sequence:
             print(json.dumps({
                 'error': 'Missing required fields: text and pattern_sequence'
@@ -298,10 +692,63 @@ def process_api_request():
         }))
 
 
+def serve(stream_in=sys.stdin, stream_out=sys.stdout):
+    """
+    Serve pattern requests as JSON lines until the input stream closes.
+
+    Each request is a JSON object with "text", "pattern_sequence", an
+    optional "replace_by" (default '[BLURRED]') and an optional "id" that
+    is echoed back. A request may send "patterns", a list of
+    {"pattern_sequence", "replace_by"}, instead of "pattern_sequence" to
+    apply them all in one pass with replace_custom_patterns(). Each
+    response carries the processed text under
+    "processed", or an "error", and the time spent under "latency_ms".
+    {"command": "stats"} returns the pattern registry counters under "stats".
+    """
+    for line in stream_in:
+        line = line.strip()
+        if not line:
+            continue
+
+        start = time.perf_counter()
+        request_id = None
+        try:
+            request = json.loads(line)
+            request_id = request.get("id")
+            if request.get("command") == "stats":
+                reply = {"id": request_id, "stats": registry.snapshot()}
+            elif request.get("text") and request.get("patterns"):
+                processed = replace_custom_patterns(request["text"], request["patterns"])
+                reply = {"id": request_id, "processed": processed}
+            elif not request.get("text") or not request.get("pattern_sequence"):
+                reply = {"id": request_id, "error": "Missing required fields: text and pattern_sequence"}
+            else:
+                processed = replace_custom_pattern(
+                    original_string=request["text"],
+                    pattern_sequence=request["pattern_sequence"],
+                    replace_by=request.get("replace_by", "[BLURRED]")
+                )
+                reply = {"id": request_id, "processed": processed}
+        except ValueError as e:
+            reply = {"id": request_id, "error": f"Pattern processing error: {str(e)}"}
+        except Exception as e:
+            reply = {"id": request_id, "error": f"Unexpected error: {str(e)}"}
+        reply["latency_ms"] = round((time.perf_counter() - start) * 1000, 3)
+
+        stream_out.write(json.dumps(reply) + "\n")
+        stream_out.flush()
+
+
 # --- Main Execution Block ---
 if __name__ == "__main__":
+    if len(sys.argv) > 1 and sys.argv[1] == "--serve":
+        # Stay resident and answer JSON-line requests from stdin
+        serve()
+    elif len(sys.argv) > 1 and sys.argv[1] == "--stream":
+        # Replace patterns in files or stdin chunk by chunk, writing as it goes
+        stream_main(sys.argv[2:])
     # Check if running in API mode (has stdin input)
-    if not sys.stdin.isatty():
+    elif not sys.stdin.isatty():
         process_api_request()
     else:
         # Interactive mode
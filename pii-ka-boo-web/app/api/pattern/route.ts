@@ -1,15 +1,36 @@
 import { NextRequest, NextResponse } from "next/server";
-import { spawn } from "child_process";
 import { join } from "path";
+import { PythonWorkerPool } from "@/lib/pythonWorkerPool";
+
+export const runtime = "nodejs"; // must use node runtime
+
+// Pattern workers stay alive across requests and keep compiled patterns in
+// their registry. Kept on globalThis to survive dev reloads.
+const globalForPool = globalThis as unknown as {
+  patternWorkerPool?: PythonWorkerPool;
+};
+
+function workerPool() {
+  if (!globalForPool.patternWorkerPool) {
+    globalForPool.patternWorkerPool = new PythonWorkerPool({
+      command: "python",
+      args: [join(process.cwd(), "app", "api", "pattern", "code.py"), "--serve"],
+      size: Number(process.env.PATTERN_WORKER_POOL_SIZE) || 1,
+      timeoutMs: Number(process.env.PATTERN_WORKER_TIMEOUT_MS) || 30000,
+    });
+  }
+  return globalForPool.patternWorkerPool;
+}
 
 export async function POST(request: NextRequest) {
   try {
     const body = await request.json();
-    console.log("Pattern API received body:", JSON.stringify(body, null, 2));
 
-    const { text, pattern_sequence, replace_by = "[BLURRED]" } = body;
+    // Either one pattern_sequence, or a list of { pattern_sequence, replace_by }
+    // applied together in a single pass
+    const { text, pattern_sequence, patterns, replace_by = "[BLURRED]" } = body;
 
-    if (!text || !pattern_sequence) {
+    if (!text || (!pattern_sequence && !patterns)) {
       console.log("Pattern API missing required fields");
       return NextResponse.json(
         { error: "Missing required fields: text and pattern_sequence" },
@@ -17,93 +38,32 @@ export async function POST(request: NextRequest) {
       );
     }
 
-    const pythonScriptPath = join(
-      process.cwd(),
-      "app",
-      "api",
-      "pattern",
-      "code.py"
-    );
-
-    return new Promise<NextResponse>((resolve) => {
-      const pythonProcess = spawn("python", [pythonScriptPath], {
-        stdio: ["pipe", "pipe", "pipe"],
-      });
-
-      let result = "";
-      let error = "";
-
-      pythonProcess.stdout.on("data", (data) => {
-        result += data.toString();
-      });
-
-      pythonProcess.stderr.on("data", (data) => {
-        error += data.toString();
-      });
-
-      pythonProcess.on("close", (code) => {
-        if (code !== 0) {
-          console.error("Python script error:", error);
-          resolve(
-            NextResponse.json(
-              { error: "Pattern processing failed" },
-              { status: 500 }
-            )
-          );
-          return;
-        }
-
-        try {
-          // The Python script outputs the processed text directly
-          // We need to handle both error cases (JSON) and success cases (plain text)
-          const trimmedResult = result.trim();
-          
-          // First, try to parse as JSON (for error cases)
-          try {
-            const jsonResponse = JSON.parse(trimmedResult);
-            if (jsonResponse.error) {
-              resolve(
-                NextResponse.json(
-                  { error: jsonResponse.error },
-                  { status: 400 }
-                )
-              );
-              return;
-            }
-          } catch (jsonError) {
-            // Not JSON, so it's the processed text
-            console.log("Python output is not JSON, treating as processed text");
-          }
-
-          // If we get here, the output is the processed text
-          const processedText = trimmedResult;
-
-          resolve(
-            NextResponse.json({
-              success: true,
-              original: text,
-              processed: processedText,
-              pattern_sequence,
-            })
-          );
-        } catch (parseError) {
-          console.error("Error parsing Python output:", parseError);
-          resolve(
-            NextResponse.json(
-              { error: "Failed to parse pattern processing result" },
-              { status: 500 }
-            )
-          );
-        }
-      });
+    let result;
+    try {
+      result = await workerPool().request(
+        patterns ? { text, patterns } : { text, pattern_sequence, replace_by }
+      );
+    } catch (error) {
+      // Errors reported by the worker are about the pattern itself
+      const message = error instanceof Error ? error.message : String(error);
+      if (message.startsWith("Python worker error: ")) {
+        return NextResponse.json(
+          { error: message.slice("Python worker error: ".length) },
+          { status: 400 }
+        );
+      }
+      console.error("Python worker error:", message);
+      return NextResponse.json(
+        { error: "Pattern processing failed" },
+        { status: 500 }
+      );
+    }
 
-      const input = JSON.stringify({
-        text,
-        pattern_sequence,
-        replace_by,
-      });
-      pythonProcess.stdin.write(input + "\n");
-      pythonProcess.stdin.end();
+    return NextResponse.json({
+      success: true,
+      original: text,
+      processed: result.processed,
+      ...(patterns ? { patterns } : { pattern_sequence }),
     });
   } catch (error) {
     console.error("Pattern API error:", error);
@@ -0,0 +1,47 @@
+"""
+Check redact_dataset() on a JSONL file with nested list and dict cells.
+
+String cells must be redacted and every other cell (numbers, nulls,
+lists, dicts) written back unchanged. Uses the regex detectors only, so
+no model is needed. Exits 1 on any difference. Run from pii-ka-boo-web/:
+
+    python app/api/text/benchmarks/dataset_check.py
+"""
+import json
+import os
+import sys
+import tempfile
+
+# Add the parent directory to sys.path to import script.py
+parent_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.append(parent_dir)
+from script import redact_dataset
+
+FIXTURES = os.path.join(os.path.dirname(__file__), "fixtures", "dataset_records.jsonl")
+
+def load(path):
+    with open(path, "r", encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+def main():
+    with tempfile.TemporaryDirectory() as tmp:
+        out_path = os.path.join(tmp, "out.jsonl")
+        stats = redact_dataset(FIXTURES, out_path)
+        before, after = load(FIXTURES), load(out_path)
+
+    problems = []
+    for old, new in zip(before, after):
+        for column, value in old.items():
+            if isinstance(value, str) and value:
+                if new[column] == value:
+                    problems.append(f"record {old['id']}: {column} not redacted")
+            elif new[column] != value:
+                problems.append(f"record {old['id']}: {column} changed from {value!r} to {new[column]!r}")
+    if len(after) != len(before):
+        problems.append(f"wrote {len(after)} records, expected {len(before)}")
+
+    print(json.dumps({"records": len(after), "stats": stats, "problems": problems}, indent=2))
+    sys.exit(1 if problems else 0)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,68 @@
+"""
+Skip rate, missed-span rate and throughput of the NER gate on a labelled corpus.
+
+Only NAME and ADDRESS count towards the missed-span rate: the other labels
+are still found by the regexes when the model is skipped. Run from
+pii-ka-boo-web/:
+
+    python app/api/text/benchmarks/gate_eval.py --gate lexical
+"""
+import argparse
+import json
+import os
+import sys
+import time
+
+# Time real work rather than span cache hits
+os.environ["PII_SPAN_CACHE_SIZE"] = "0"
+
+# Add the parent directory to sys.path to import script.py
+parent_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.append(parent_dir)
+import script
+
+FIXTURES = os.path.join(os.path.dirname(__file__), "fixtures", "pii_samples.jsonl")
+NER_ONLY_LABELS = {"NAME", "ADDRESS"}
+
+def load_samples(path):
+    with open(path, "r", encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+def docs_per_second(texts, gate, repeat):
+    script.NER_GATE = gate
+    script.redact_batch(texts[:1])  # warm up
+    start = time.perf_counter()
+    for _ in range(repeat):
+        for text in texts:
+            script.redact(text)
+    return repeat * len(texts) / (time.perf_counter() - start)
+
+def main():
+    parser = argparse.ArgumentParser(description="Evaluate the NER gate against labelled samples.")
+    parser.add_argument("--corpus", default=FIXTURES, help="JSONL with 'text' and 'entities' fields.")
+    parser.add_argument("--gate", default="lexical", help="Gate to evaluate.")
+    parser.add_argument("--repeat", type=int, default=5, help="Timed passes over the corpus.")
+    args = parser.parse_args()
+
+    samples = load_samples(args.corpus)
+    skipped = [s for s in samples if not script.ner_gate(s["text"], args.gate)]
+    entities = [e for s in samples for e in s["entities"] if e["label"] in NER_ONLY_LABELS]
+    missed = [e for s in skipped for e in s["entities"] if e["label"] in NER_ONLY_LABELS]
+
+    texts = [s["text"] for s in samples]
+    base = docs_per_second(texts, "off", args.repeat)
+    gated = docs_per_second(texts, args.gate, args.repeat)
+
+    print(json.dumps({
+        "gate": args.gate,
+        "texts": len(samples),
+        "skip_rate": round(len(skipped) / max(1, len(samples)), 4),
+        "ner_only_entities": len(entities),
+        "missed_span_rate": round(len(missed) / max(1, len(entities)), 4),
+        "missed": missed,
+        "docs_per_s_off": round(base, 1),
+        "docs_per_s_gated": round(gated, 1),
+    }, indent=2))
+
+if __name__ == "__main__":
+    main()
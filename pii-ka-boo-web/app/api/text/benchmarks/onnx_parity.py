@@ -0,0 +1,124 @@
+"""
+Parity, latency and memory check between the torch and onnx NER backends.
+
+Each backend runs in its own subprocess so peak RSS is measured in
+isolation. Run from pii-ka-boo-web/ after exporting the ONNX model:
+
+    python app/api/text/onnx_backend.py
+    python app/api/text/benchmarks/onnx_parity.py
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+
+FIXTURES = os.path.join(os.path.dirname(__file__), "fixtures", "pii_samples.jsonl")
+
+def load_texts(path):
+    with open(path, "r", encoding="utf-8") as f:
+        return [json.loads(line)["text"] for line in f if line.strip()]
+
+def span_keys(spans):
+    """Compare spans by position and label only; scores are checked separately."""
+    return [(s["start"], s["end"], s["label"]) for s in spans]
+
+def score_diffs(a, b):
+    """Absolute score difference of each span both backends found."""
+    scores = {(s["start"], s["end"], s["label"]): s.get("score") for s in b}
+    return [
+        abs(s["score"] - scores[key])
+        for s, key in zip(a, span_keys(a))
+        if s.get("score") is not None and scores.get(key) is not None
+    ]
+
+def peak_rss_mb():
+    try:
+        import resource
+    except ImportError:  # Windows
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in bytes on macOS and kilobytes elsewhere
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+def run_worker(corpus, repeat):
+    """Load the backend chosen by PII_NER_BACKEND, time ner_spans over the corpus and print a JSON report."""
+    start = time.perf_counter()
+    # Add the parent directory to sys.path to import script.py
+    sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+    from script import ner_spans
+    load_s = time.perf_counter() - start
+
+    texts = load_texts(corpus)
+    spans = [ner_spans(t) for t in texts]  # also warms up the backend
+
+    latencies = []
+    for _ in range(repeat):
+        for t in texts:
+            t0 = time.perf_counter()
+            ner_spans(t)
+            latencies.append((time.perf_counter() - t0) * 1000)
+    latencies.sort()
+
+    print(json.dumps({
+        "spans": spans,
+        "load_s": round(load_s, 3),
+        "p50_ms": round(latencies[len(latencies) // 2], 3),
+        "mean_ms": round(sum(latencies) / len(latencies), 3),
+        "peak_rss_mb": peak_rss_mb(),
+    }))
+
+def run_backend(backend, corpus, repeat):
+    env = dict(os.environ, PII_NER_BACKEND=backend)
+    out = subprocess.run(
+        [sys.executable, __file__, "--worker", "--corpus", corpus, "--repeat", str(repeat)],
+        env=env, capture_output=True, text=True, check=True,
+    )
+    return json.loads(out.stdout.strip().splitlines()[-1])
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare torch and onnx NER backends.")
+    parser.add_argument("--corpus", default=FIXTURES, help="JSONL file with a 'text' field per line.")
+    parser.add_argument("--repeat", type=int, default=5, help="Timed passes over the corpus per backend.")
+    parser.add_argument("--min-agreement", type=float, default=0.95,
+                        help="Fraction of texts whose span positions and labels must match exactly.")
+    parser.add_argument("--score-tolerance", type=float, default=0.1,
+                        help="Largest allowed score difference on a span both backends found.")
+    parser.add_argument("--worker", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        run_worker(args.corpus, args.repeat)
+        return
+
+    torch_report = run_backend("torch", args.corpus, args.repeat)
+    onnx_report = run_backend("onnx", args.corpus, args.repeat)
+
+    texts = load_texts(args.corpus)
+    mismatches = [
+        (text, a, b)
+        for text, a, b in zip(texts, torch_report["spans"], onnx_report["spans"])
+        if span_keys(a) != span_keys(b)
+    ]
+    agreement = 1 - len(mismatches) / max(1, len(texts))
+    diffs = [d for a, b in zip(torch_report["spans"], onnx_report["spans"]) for d in score_diffs(a, b)]
+    over = [d for d in diffs if d > args.score_tolerance]
+
+    print(f"{'backend':<8} {'load s':>8} {'p50 ms':>8} {'mean ms':>8} {'peak RSS MB':>12}")
+    for name, report in (("torch", torch_report), ("onnx", onnx_report)):
+        rss = "n/a" if report["peak_rss_mb"] is None else f"{report['peak_rss_mb']:.0f}"
+        print(f"{name:<8} {report['load_s']:>8.2f} {report['p50_ms']:>8.2f} {report['mean_ms']:>8.2f} {rss:>12}")
+    print(f"speedup (mean): {torch_report['mean_ms'] / onnx_report['mean_ms']:.2f}x")
+    print(f"span agreement: {len(texts) - len(mismatches)}/{len(texts)} texts ({agreement:.1%})")
+    for text, a, b in mismatches:
+        print(f"  MISMATCH {text!r}\n    torch: {a}\n    onnx:  {b}")
+    if diffs:
+        print(f"score difference: max {max(diffs):.4f}, mean {sum(diffs) / len(diffs):.4f} over {len(diffs)} spans, "
+              f"{len(over)} above {args.score_tolerance}")
+
+    if agreement < args.min_agreement or over:
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,94 @@
+"""
+Throughput of the prefiltered regex scanner against the plain per-label loop.
+
+Also checks that both give the same spans after merge_spans, on the
+generated corpora and on short cases where matches of different labels
+partially overlap. Exits 1 on any mismatch.
+
+Run from pii-ka-boo-web/ (script.py loads the model relative to it):
+
+    python app/api/text/benchmarks/regex_scan.py --mb 4
+"""
+import argparse
+import os
+import random
+import sys
+import time
+
+# Add the parent directory to sys.path to import script.py
+parent_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.append(parent_dir)
+from script import PII_PATTERNS, regex_spans, merge_spans
+
+FILLER = "the quick brown fox jumps over the lazy dog while we wait for the report".split()
+PII = [
+    "john.doe@example.com", "+65 9123 4567", "(555) 123-4567", "https://github.com/jdoe",
+    "@jdoe_99", "order 20231104", "555.867.5309",
+]
+
+# Partial overlaps between labels, which a single non-overlapping scan gets wrong
+OVERLAP_CASES = [
+    "text me @9123 4567 thanks",
+    "dm @1234 5678 9012",
+    "12 3456 7890@work.com",
+    "see https://example.com/u/@jdoe or jdoe@example.com",
+    "call +65 9123 4567@home",
+]
+
+def per_label_spans(text, target_labels=None):
+    """One full scan of the text per label, without prefilters."""
+    out = []
+    for label, pattern in PII_PATTERNS.items():
+        if target_labels and label not in target_labels:
+            continue
+        for m in pattern.finditer(text):
+            out.append({"start": m.start(), "end": m.end(), "label": label})
+    return out
+
+def make_corpus(kind, size, seed=0):
+    rng = random.Random(seed)
+    parts, n = [], 0
+    while n < size:
+        if kind == "prose":
+            piece = rng.choice(FILLER)
+        elif kind == "digits":
+            piece = "".join(rng.choice("0123456789-.() ") for _ in range(rng.randint(4, 24)))
+        else:
+            piece = rng.choice(PII) if rng.random() < 0.05 else rng.choice(FILLER)
+        parts.append(piece)
+        n += len(piece) + 1
+    return " ".join(parts)[:size]
+
+def timed(fn, text, repeat):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn(text)
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark regex_spans against the plain per-label loop.")
+    parser.add_argument("--mb", type=float, default=2.0, help="Corpus size in megabytes.")
+    parser.add_argument("--repeat", type=int, default=3, help="Runs per case; the best one is reported.")
+    args = parser.parse_args()
+
+    mismatches = 0
+    for text in OVERLAP_CASES:
+        same = merge_spans(per_label_spans(text)) == merge_spans(regex_spans(text))
+        mismatches += not same
+        print(f"{'same' if same else 'DIFFERENT':<10} {text!r}")
+
+    size = int(args.mb * 1024 * 1024)
+    print(f"{'corpus':<8} {'per-label MB/s':>15} {'prefiltered MB/s':>17} {'speedup':>8} {'same spans':>11}")
+    for kind in ("mixed", "prose", "digits"):
+        text = make_corpus(kind, size)
+        t_old, old = timed(per_label_spans, text, args.repeat)
+        t_new, new = timed(regex_spans, text, args.repeat)
+        same = merge_spans(old) == merge_spans(new)
+        mismatches += not same
+        print(f"{kind:<8} {args.mb / t_old:>15.1f} {args.mb / t_new:>17.1f} {t_old / t_new:>7.2f}x {str(same):>11}")
+    sys.exit(1 if mismatches else 0)
+
+if __name__ == "__main__":
+    main()
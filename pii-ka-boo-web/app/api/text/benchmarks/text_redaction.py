@@ -0,0 +1,195 @@
+"""
+Throughput, latency and memory of the text redaction path on a synthetic corpus.
+
+Times redact() end to end and its stages (regex_spans, ner_spans,
+merge_spans, coalesce_same_label_spans) over seeded documents of several
+lengths and PII densities, for each label subset, and prints the results
+as JSON. Run from pii-ka-boo-web/:
+
+    python app/api/text/benchmarks/text_redaction.py --out bench.json
+
+Compare two runs to catch regressions; the corpus is identical for the
+same --seed, --lengths, --densities and --docs.
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import resource
+import sys
+import time
+
+# Time real work rather than span cache hits
+os.environ["PII_SPAN_CACHE_SIZE"] = "0"
+
+# Add the parent directory to sys.path to import script.py
+parent_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.append(parent_dir)
+import script
+
+FIRST_NAMES = ["Sarah", "David", "Wei Ling", "Ahmad", "Priya", "John", "Mei", "Carlos", "Aisha", "Tom"]
+LAST_NAMES = ["Connor", "Lim", "Tan", "Rahman", "Nair", "Smith", "Wong", "Garcia", "Okafor", "Brown"]
+STREETS = ["Orchard Road", "Jalan Bukit Merah", "Baker Street", "Main Street", "Elm Avenue", "Clementi Ave 3"]
+DOMAINS = ["example.com", "mail.com", "company.org", "uni.edu.sg"]
+FILLER = (
+    "could you please look over the notes from our meeting and let me know whether "
+    "the schedule still works for the team since we need to finalise the budget "
+    "before the end of the quarter and send a summary to everyone involved"
+).split()
+
+# Label subsets to redact, by name
+LABEL_SUBSETS = {
+    "all": None,
+    "regex_only": {"EMAIL", "PHONE", "URL_PERSONAL", "USERNAME"},
+    "ner_only": {"NAME", "ADDRESS"},
+}
+
+def fake_entity(rng):
+    """A random (label, text) pair for one of the generated PII kinds."""
+    first, last = rng.choice(FIRST_NAMES), rng.choice(LAST_NAMES)
+    kind = rng.choice(["NAME", "EMAIL", "PHONE", "ADDRESS"])
+    if kind == "NAME":
+        return kind, f"{first} {last}"
+    if kind == "EMAIL":
+        user = f"{first.split()[0]}.{last}".lower()
+        return kind, f"{user}{rng.randint(1, 99)}@{rng.choice(DOMAINS)}"
+    if kind == "PHONE":
+        return kind, rng.choice([
+            f"+65 {rng.randint(8000, 9999)} {rng.randint(1000, 9999)}",
+            f"({rng.randint(200, 999)}) {rng.randint(200, 999)}-{rng.randint(1000, 9999)}",
+        ])
+    return kind, f"{rng.randint(1, 999)} {rng.choice(STREETS)}"
+
+def make_document(rng, length, density):
+    """
+    One document of about length characters with PII embedded in filler words.
+
+    Args:
+        rng: random.Random to draw from
+        length: Target length in characters
+        density: Fraction of inserted pieces that are PII (0 to 1)
+
+    Returns:
+        (text, entities) where entities lists {"label", "text"} in order
+    """
+    parts, entities, n = [], [], 0
+    while n < length:
+        if rng.random() < density:
+            label, piece = fake_entity(rng)
+            entities.append({"label": label, "text": piece})
+        else:
+            piece = rng.choice(FILLER)
+        parts.append(piece)
+        n += len(piece) + 1
+    return " ".join(parts) + ".", entities
+
+def make_corpus(lengths, densities, docs, seed=0):
+    """Seeded corpus of docs documents for every (length, density) pair."""
+    rng = random.Random(seed)
+    corpus = []
+    for length in lengths:
+        for density in densities:
+            for _ in range(docs):
+                text, entities = make_document(rng, length, density)
+                corpus.append({"length": length, "density": density, "text": text, "entities": entities})
+    return corpus
+
+def percentile(sorted_values, q):
+    """Nearest-rank percentile of an already sorted list."""
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, max(0, round(q / 100 * len(sorted_values)) - 1))
+    return sorted_values[index]
+
+def peak_rss_mb():
+    """Peak resident set size of this process so far, in megabytes."""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in bytes on macOS and kilobytes elsewhere
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+def stages(labels):
+    """The timed functions for a label subset, each taking one text."""
+    # redact() takes the labels to leave alone, the stages take those to redact
+    keep = None if labels is None else [label for label in script.ALL_LABELS if label not in labels]
+
+    def regex_stage(text):
+        return script.regex_spans(text, labels)
+
+    def ner_stage(text):
+        return script.ner_spans(text, labels)
+
+    def merge_stage(text):
+        spans = script.regex_spans(text, labels) + script.ner_spans(text, labels)
+        return script.coalesce_same_label_spans(script.merge_spans(spans), text)
+
+    return {
+        "redact": lambda text: script.redact(text, keep),
+        "regex_spans": regex_stage,
+        "ner_spans": ner_stage,
+        "merge_spans+coalesce": merge_stage,
+    }
+
+def measure(fn, texts, repeat):
+    """Time fn on every text repeat times and summarise the latencies."""
+    latencies = []
+    for _ in range(repeat):
+        for text in texts:
+            start = time.perf_counter()
+            fn(text)
+            latencies.append(time.perf_counter() - start)
+    latencies.sort()
+    total = sum(latencies)
+    chars = repeat * sum(len(text) for text in texts)
+    return {
+        "docs": len(latencies),
+        "chars_per_s": round(chars / total, 1) if total else None,
+        "docs_per_s": round(len(latencies) / total, 2) if total else None,
+        "p50_ms": round(percentile(latencies, 50) * 1000, 3),
+        "p95_ms": round(percentile(latencies, 95) * 1000, 3),
+        "p99_ms": round(percentile(latencies, 99) * 1000, 3),
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the text redaction path on a synthetic corpus.")
+    parser.add_argument("--lengths", default="100,1000,5000", help="Comma-separated document lengths in characters.")
+    parser.add_argument("--densities", default="0,0.05,0.2", help="Comma-separated fractions of PII pieces.")
+    parser.add_argument("--docs", type=int, default=20, help="Documents per (length, density) pair.")
+    parser.add_argument("--labels", default=",".join(LABEL_SUBSETS), help="Comma-separated label subsets to run.")
+    parser.add_argument("--repeat", type=int, default=3, help="Timed passes over each group.")
+    parser.add_argument("--seed", type=int, default=0, help="Corpus seed.")
+    parser.add_argument("--out", default=None, help="Write the JSON report here as well as to stdout.")
+    args = parser.parse_args()
+
+    lengths = [int(x) for x in args.lengths.split(",")]
+    densities = [float(x) for x in args.densities.split(",")]
+    corpus = make_corpus(lengths, densities, args.docs, args.seed)
+    script.redact_batch([doc["text"] for doc in corpus[:4]])  # warm up
+
+    results = []
+    for subset in args.labels.split(","):
+        for stage, fn in stages(LABEL_SUBSETS[subset]).items():
+            for length in lengths:
+                for density in densities:
+                    texts = [d["text"] for d in corpus if d["length"] == length and d["density"] == density]
+                    results.append({"stage": stage, "labels": subset, "length": length, "density": density,
+                                    **measure(fn, texts, args.repeat)})
+
+    report = {
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "backend": script.NER_BACKEND,
+        "gate": script.NER_GATE,
+        "seed": args.seed,
+        "corpus_docs": len(corpus),
+        "results": results,
+        "peak_rss_mb": round(peak_rss_mb(), 1),
+    }
+    out = json.dumps(report, indent=2)
+    print(out)
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            f.write(out + "\n")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,83 @@
+"""
+ONNX Runtime backend for the pii-ner-fast token classifier.
+
+Export and quantize the model once, from pii-ka-boo-web/:
+
+    python app/api/text/onnx_backend.py
+
+then run the text API with PII_NER_BACKEND=onnx.
+"""
+import argparse
+import os
+
+from transformers import AutoConfig
+
+class OnnxTokenClassifier:
+    """Token classifier served by ONNX Runtime, interchangeable with the PyTorch one in script.py."""
+
+    def __init__(self, onnx_path: str, model_dir: str, threads: int = 0):
+        import onnxruntime as ort
+
+        if not os.path.exists(onnx_path):
+            raise FileNotFoundError(
+                f"ONNX model not found: {onnx_path}. Export it with onnx_backend.py first.")
+
+        options = ort.SessionOptions()
+        options.intra_op_num_threads = threads
+        self.session = ort.InferenceSession(onnx_path, sess_options=options,
+                                            providers=["CPUExecutionProvider"])
+        self.config = AutoConfig.from_pretrained(model_dir)
+
+    def logits(self, input_ids, attention_mask):
+        return self.session.run(["logits"], {
+            "input_ids": input_ids.astype("int64"),
+            "attention_mask": attention_mask.astype("int64"),
+        })[0]
+
+def export(model_dir: str, out_dir: str, quantize: bool = True) -> str:
+    """Export the model to ONNX with dynamic batch/sequence axes, optionally int8-quantized. Returns the model path."""
+    import torch
+    from transformers import AutoTokenizer, AutoModelForTokenClassification
+
+    tok = AutoTokenizer.from_pretrained(model_dir)
+    mdl = AutoModelForTokenClassification.from_pretrained(model_dir)
+    mdl.eval()
+
+    os.makedirs(out_dir, exist_ok=True)
+    fp32_path = os.path.join(out_dir, "model.onnx")
+    sample = tok(["export sample", "a slightly longer export sample"], padding=True, return_tensors="pt")
+    torch.onnx.export(
+        mdl,
+        (sample["input_ids"], sample["attention_mask"]),
+        fp32_path,
+        input_names=["input_ids", "attention_mask"],
+        output_names=["logits"],
+        dynamic_axes={
+            "input_ids": {0: "batch", 1: "sequence"},
+            "attention_mask": {0: "batch", 1: "sequence"},
+            "logits": {0: "batch", 1: "sequence"},
+        },
+        opset_version=14,
+        dynamo=False,
+    )
+    if not quantize:
+        return fp32_path
+
+    from onnxruntime.quantization import quantize_dynamic, QuantType
+
+    int8_path = os.path.join(out_dir, "model.int8.onnx")
+    quantize_dynamic(fp32_path, int8_path, weight_type=QuantType.QInt8)
+    return int8_path
+
+def main():
+    parser = argparse.ArgumentParser(description="Export pii-ner-fast to ONNX for the onnx text backend.")
+    parser.add_argument("--model-dir", default="./app/api/text/pii-ner-fast", help="Hugging Face model folder.")
+    parser.add_argument("--output", default="./app/api/text/pii-ner-fast-onnx", help="Folder for the exported model.")
+    parser.add_argument("--no-quantize", action="store_true", help="Keep fp32 weights instead of dynamic int8.")
+    args = parser.parse_args()
+
+    path = export(args.model_dir, args.output, quantize=not args.no_quantize)
+    print(f"Saved ONNX model -> {path}")
+
+if __name__ == "__main__":
+    main()
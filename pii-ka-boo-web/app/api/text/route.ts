@@ -1,6 +1,6 @@
 import { NextRequest, NextResponse } from "next/server";
-import { spawn } from "child_process";
 import path from "path";
+import { PythonWorkerPool } from "@/lib/pythonWorkerPool";
 
 export const runtime = "nodejs"; // must use node runtime
 
@@ -10,6 +10,8 @@ export async function POST(req: NextRequest) {
     const message = body.message ?? "";
     const labels = body.labels; // Optional array of labels to redact
     const customPatterns = body.customPatterns || []; // Custom regex patterns
+    // Optional { text, state } from the previous turn of a growing transcript
+    const previous = body.previous;
 
     console.log("Received message:", message);
     console.log("Labels to redact:", labels);
@@ -20,7 +22,7 @@ export async function POST(req: NextRequest) {
     // This endpoint only handles regular PII detection
     let processedMessage = message;
 
-    const result = await runPython(processedMessage, labels);
+    const result = await runPython(processedMessage, labels, previous);
     return NextResponse.json(result);
   } catch (error) {
     console.error("Error processing request:", error);
@@ -40,49 +42,41 @@ function pythonExe() {
   }
 }
 
-// helper to run python
-function runPython(message: string, labels?: string[]): Promise<any> {
-  return new Promise((resolve, reject) => {
-    // Prepare arguments for Python script
-    const args = ["./app/api/text/script.py", message];
-
-    // Add labels as a JSON string if provided
-    if (labels && labels.length > 0) {
-      args.push(JSON.stringify(labels));
-    }
-
-    const process = spawn(pythonExe(), args);
-
-    let output = "";
-    let error = "";
-
-    process.stdout.on("data", (data) => {
-      output += data.toString();
-    });
+// Workers stay alive across requests so the model is loaded once per worker
+// instead of once per message. Kept on globalThis to survive dev reloads.
+const globalForPool = globalThis as unknown as {
+  textWorkerPool?: PythonWorkerPool;
+};
 
-    process.stderr.on("data", (data) => {
-      error += data.toString();
-    });
-
-    process.on("close", (code) => {
-      if (code !== 0) {
-        reject(new Error(`Python script failed: ${error}`));
-      } else {
-        try {
-          // Handle multiple lines of output and parse the last JSON response
-          const lines = output.trim().split("\n");
-          const lastLine = lines[lines.length - 1];
-          resolve(JSON.parse(lastLine));
-        } catch (e) {
-          console.error("Raw Python output:", output);
-          reject(new Error(`Invalid JSON from Python: ${output}`));
-        }
-      }
+function workerPool() {
+  if (!globalForPool.textWorkerPool) {
+    globalForPool.textWorkerPool = new PythonWorkerPool({
+      command: pythonExe(),
+      args: ["./app/api/text/script.py", "--serve"],
+      size: Number(process.env.TEXT_WORKER_POOL_SIZE) || 2,
+      timeoutMs: Number(process.env.TEXT_WORKER_TIMEOUT_MS) || 30000,
     });
+  }
+  return globalForPool.textWorkerPool;
+}
 
-    // Handle process errors
-    process.on("error", (err) => {
-      reject(new Error(`Failed to start Python process: ${err.message}`));
-    });
+// helper to run python
+async function runPython(
+  message: string,
+  labels?: string[],
+  previous?: { text: string; state: unknown }
+): Promise<any> {
+  const result = await workerPool().request({
+    text: message,
+    labels: labels && labels.length > 0 ? labels : null,
+    previous: previous ?? null,
+    placeholders: true,
   });
+  console.log(`Text redaction took ${result.latency_ms} ms`);
+  return {
+    response: result.response,
+    state: result.state,
+    placeholders: result.placeholders,
+    latency_ms: result.latency_ms,
+  };
 }
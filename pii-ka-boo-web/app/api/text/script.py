@@ -1,24 +1,119 @@
+import os
 import re
+import hashlib
 import sys
 import json
+import time
 from collections import defaultdict
-from transformers import AutoTokenizer, AutoModelForTokenClassification
-import torch
+import numpy as np
+from transformers import AutoTokenizer
+from span_cache import SpanCache, span_key
 
 MODEL_DIR = "./app/api/text/pii-ner-fast"
 
+# Inference backend: "torch" (eager fp32) or "onnx" (ONNX Runtime, see onnx_backend.py)
+NER_BACKEND = os.getenv("PII_NER_BACKEND", "torch")
+ONNX_MODEL_PATH = os.getenv("PII_NER_ONNX_MODEL", "./app/api/text/pii-ner-fast-onnx/model.int8.onnx")
+# Intra-op threads for inference; 0 leaves the library default (all cores)
+NER_THREADS = int(os.getenv("PII_NER_THREADS", 0))
+
+class TorchTokenClassifier:
+    """Eager PyTorch inference over the Hugging Face checkpoint."""
+
+    def __init__(self, model_dir, threads=0):
+        import torch
+        from transformers import AutoModelForTokenClassification
+
+        self.torch = torch
+        if threads > 0:
+            torch.set_num_threads(threads)
+        self.model = AutoModelForTokenClassification.from_pretrained(model_dir)
+        self.model.eval()
+        self.config = self.model.config
+
+    def logits(self, input_ids, attention_mask):
+        with self.torch.no_grad():
+            out = self.model(input_ids=self.torch.from_numpy(input_ids),
+                             attention_mask=self.torch.from_numpy(attention_mask))
+        return out.logits.numpy()
+
+def load_model(backend=NER_BACKEND):
+    """Build the token classifier for the configured backend."""
+    if backend == "onnx":
+        from onnx_backend import OnnxTokenClassifier
+        return OnnxTokenClassifier(ONNX_MODEL_PATH, MODEL_DIR, threads=NER_THREADS)
+    if backend == "torch":
+        return TorchTokenClassifier(MODEL_DIR, threads=NER_THREADS)
+    raise ValueError(f"Unknown NER backend: '{backend}'")
+
 # Initialize tokenizer and model
 tok = AutoTokenizer.from_pretrained(MODEL_DIR)
-mdl = AutoModelForTokenClassification.from_pretrained(MODEL_DIR)
-mdl.eval()
+mdl = load_model()
+
+
+# Long inputs are split into overlapping windows of NER_MAX_LENGTH tokens.
+# Neighbouring windows share NER_STRIDE tokens. Windows are grouped into
+# padded batches of at most NER_BATCH_TOKENS tokens (batch size times the
+# longest window) so memory stays bounded.
+NER_MAX_LENGTH = 512
+NER_STRIDE = int(os.getenv("PII_NER_STRIDE", 128))
+NER_BATCH_TOKENS = int(os.getenv("PII_NER_BATCH_TOKENS", 8192))
+
+# NER spans whose mean token confidence is below this are dropped
+NER_MIN_SCORE = float(os.getenv("PII_NER_MIN_SCORE", 0.0))
+
+ALL_LABELS = ["NAME", "ADDRESS", "EMAIL", "PHONE", "URL_PERSONAL", "USERNAME"]
+
+# Cheap gate in front of the NER model: "off" always runs it, "lexical"
+# skips it for texts with no sign of a name or address (see ner_gate).
+# Regex detection runs either way.
+NER_GATE = os.getenv("PII_NER_GATE", "off")
+
+# Spans are cached per (text, labels, model revision): SPAN_CACHE_SIZE
+# entries in memory (0 disables) plus an optional SQLite file that
+# survives restarts.
+SPAN_CACHE_SIZE = int(os.getenv("PII_SPAN_CACHE_SIZE", 1024))
+SPAN_CACHE_PATH = os.getenv("PII_SPAN_CACHE_PATH")
+
+# redact_incremental() rescans this many characters before the point where
+# the new text departs from the previous one
+INCREMENTAL_MARGIN = int(os.getenv("PII_INCREMENTAL_MARGIN", 256))
+
+# Streaming redaction cuts the input into chunks of about this many
+# characters at line boundaries, and tags this many chunks per batch
+STREAM_CHUNK_CHARS = int(os.getenv("PII_STREAM_CHUNK_CHARS", 4096))
+STREAM_BATCH_CHUNKS = int(os.getenv("PII_STREAM_BATCH_CHUNKS", 16))
+
+def model_revision():
+    """
+    Fingerprint everything that decides which spans a text gets.
+
+    Covers the backend and its weights file, the model config, the window
+    stride, the confidence threshold, the NER gate and this file's own
+    source, so editing any of them invalidates cached spans.
+    """
+    weights = ONNX_MODEL_PATH if NER_BACKEND == "onnx" else os.path.join(MODEL_DIR, "model.safetensors")
+    h = hashlib.sha256()
+    for part in (NER_BACKEND, NER_GATE, str(NER_STRIDE), str(NER_MIN_SCORE),
+                 json.dumps(mdl.config.to_dict(), sort_keys=True, default=str)):
+        h.update(part.encode("utf-8"))
+    if os.path.exists(weights):
+        st = os.stat(weights)
+        h.update(f"{st.st_size}:{st.st_mtime_ns}".encode("utf-8"))
+    with open(__file__, "rb") as f:
+        h.update(f.read())
+    return h.hexdigest()[:16]
+
+MODEL_REVISION = model_revision()
+span_cache = SpanCache(SPAN_CACHE_SIZE, SPAN_CACHE_PATH) if SPAN_CACHE_SIZE > 0 or SPAN_CACHE_PATH else None
 
 def extend_spans_to_word_end(spans, text, labels={"NAME", "ADDRESS"}):
-    """Extend spans to cover complete words."""
+    """Extend spans to cover complete words, stopping short of the next span."""
     out = []
-    for s in spans:
+    for i, s in enumerate(spans):
         if s["label"] in labels:
             end = s["end"]
-            L = len(text)
+            L = spans[i + 1]["start"] if i + 1 < len(spans) else len(text)
             while end < L and re.match(r"[A-Za-z0-9'’-]", text[end]):
                 end += 1
             s = {"start": s["start"], "end": end, "label": s["label"]}
@@ -43,75 +138,247 @@ def coalesce_same_label_spans(spans, text, max_gap_chars=2):
         merged.append(s)
     return merged
 
-def predict_tags(text):
-    """Predict named entities using the transformer model."""
-    enc = tok(text, return_offsets_mapping=True, return_tensors="pt", 
-              truncation=True, max_length=512)
-    with torch.no_grad():
-        out = mdl(input_ids=enc["input_ids"], 
-                 attention_mask=enc["attention_mask"])
-    pred_ids = out.logits.argmax(-1)[0].tolist()
-    tags = [mdl.config.id2label[int(i)] for i in pred_ids]
-
-    offsets = enc["offset_mapping"][0].tolist()
-    clean_tags, clean_offs = [], []
-    for (s, e), tag in zip(offsets, tags):
-        if s == 0 and e == 0:
+def length_batches(lengths, max_tokens=NER_BATCH_TOKENS):
+    """
+    Group sequence indices into batches whose padded size stays within max_tokens.
+
+    Indices are sorted longest first so each batch holds sequences of similar
+    length and little of the padded tensor is wasted.
+    """
+    order = sorted(range(len(lengths)), key=lambda i: -lengths[i])
+    batches, cur = [], []
+    for i in order:
+        # The first (longest) member sets the padded width of the batch
+        if cur and (len(cur) + 1) * lengths[cur[0]] > max_tokens:
+            batches.append(cur)
+            cur = []
+        cur.append(i)
+    if cur:
+        batches.append(cur)
+    return batches
+
+def predict_logits(windows, max_tokens=NER_BATCH_TOKENS):
+    """Run the model over token id lists in length-bucketed batches, returning a logits array per window in input order."""
+    logits = [None] * len(windows)
+    for batch in length_batches([len(w) for w in windows], max_tokens):
+        enc = tok.pad([{"input_ids": windows[i]} for i in batch], return_tensors="np")
+        out = mdl.logits(enc["input_ids"], enc["attention_mask"])
+        for row, i in enumerate(batch):
+            logits[i] = out[row, :len(windows[i])]
+    return logits
+
+def softmax(x):
+    e = np.exp(x - x.max(axis=-1, keepdims=True))
+    return e / e.sum(axis=-1, keepdims=True)
+
+def predict_scores_batch(texts, stride=NER_STRIDE, max_length=NER_MAX_LENGTH):
+    """
+    Predict a label for every token of several texts.
+
+    Texts longer than max_length tokens are split into overlapping windows
+    that share `stride` tokens. Where windows overlap, each token keeps the
+    prediction from the window in which it sits furthest from the edge,
+    since that prediction saw the most context on both sides.
+
+    Returns:
+        Per text, in text order: character offsets (n, 2), label ids (n,)
+        and the softmax probability of each predicted label (n,).
+    """
+    if not texts:
+        return []
+    enc = tok(list(texts), return_offsets_mapping=True, truncation=True,
+              max_length=max_length, stride=stride,
+              return_overflowing_tokens=True)
+    window_logits = predict_logits(enc["input_ids"])
+
+    parts = [[] for _ in texts]
+    for doc, window_offsets, logits in zip(enc["overflow_to_sample_mapping"],
+                                           enc["offset_mapping"], window_logits):
+        offs = np.asarray(window_offsets, dtype=np.int64).reshape(-1, 2)
+        positions = np.flatnonzero(offs.any(axis=1))
+        if not len(positions):
             continue
-        clean_tags.append(tag)
-        clean_offs.append((s, e))
-    return clean_tags, clean_offs
+        margin = np.minimum(positions - positions[0], positions[-1] - positions)
+        parts[doc].append((offs[positions], margin, logits[positions]))
+
+    results = []
+    for doc_parts in parts:
+        if not doc_parts:
+            results.append((np.zeros((0, 2), dtype=np.int64), np.zeros(0, dtype=np.int64),
+                            np.zeros(0, dtype=np.float32)))
+            continue
+        offs = np.concatenate([p[0] for p in doc_parts])
+        margin = np.concatenate([p[1] for p in doc_parts])
+        logits = np.concatenate([p[2] for p in doc_parts])
+
+        # Sort by offsets with the widest margin first, then keep the first
+        # copy of each token (lexsort is stable, so ties go to the earlier window)
+        order = np.lexsort((-margin, offs[:, 1], offs[:, 0]))
+        offs, logits = offs[order], logits[order]
+        first = np.ones(len(offs), dtype=bool)
+        first[1:] = (offs[1:] != offs[:-1]).any(axis=1)
+        probs = softmax(logits[first])
+        results.append((offs[first], probs.argmax(-1), probs.max(-1)))
+    return results
+
+def predict_tags_batch(texts, stride=NER_STRIDE, max_length=NER_MAX_LENGTH):
+    """Predict named entities for several texts, returning (tags, offsets) per text."""
+    return [
+        ([mdl.config.id2label[int(i)] for i in ids], [tuple(o) for o in offs.tolist()])
+        for offs, ids, _ in predict_scores_batch(texts, stride=stride, max_length=max_length)
+    ]
+
+def predict_tags(text, stride=NER_STRIDE, max_length=NER_MAX_LENGTH):
+    """Predict named entities using the transformer model."""
+    return predict_tags_batch([text], stride=stride, max_length=max_length)[0]
+
+def bio_tables(id2label):
+    """Per label id: entity index (-1 for O) and whether it is an I- tag, plus the entity names."""
+    names = sorted({label.split("-", 1)[1] for label in id2label.values() if "-" in label})
+    size = max(int(i) for i in id2label) + 1
+    entity = np.full(size, -1, dtype=np.int64)
+    inside = np.zeros(size, dtype=bool)
+    for i, label in id2label.items():
+        if "-" in label:
+            prefix, name = label.split("-", 1)
+            entity[int(i)] = names.index(name)
+            inside[int(i)] = prefix == "I"
+    return entity, inside, names
+
+LABEL_ENTITY, LABEL_INSIDE, ENTITY_NAMES = bio_tables(mdl.config.id2label)
+LABEL_IDS = {label: int(i) for i, label in mdl.config.id2label.items()}
+
+def decode_bio_spans(offsets, label_ids, scores=None, min_score=0.0):
+    """
+    Turn per-token BIO label ids into character spans with array operations.
+
+    A token continues the span before it when it is an I- tag of the same
+    entity as the previous token and starts at most one character after it;
+    any other tagged token starts a new span. Each span's score is the mean
+    probability of its tokens' predicted labels, and spans scoring below
+    min_score are dropped.
+    """
+    offsets = np.asarray(offsets, dtype=np.int64).reshape(-1, 2)
+    ids = np.asarray(label_ids, dtype=np.int64)
+    if not len(ids):
+        return []
+    starts, ends = offsets[:, 0], offsets[:, 1]
+    entity = LABEL_ENTITY[ids]
+
+    cont = np.zeros(len(ids), dtype=bool)
+    cont[1:] = (LABEL_INSIDE[ids[1:]] & (entity[1:] == entity[:-1]) & (entity[:-1] >= 0)
+                & (starts[1:] <= ends[:-1] + 1))
+
+    tagged = np.flatnonzero(entity >= 0)
+    if not len(tagged):
+        return []
+    # Tokens of one span are consecutive in `tagged`; a token after an O
+    # can never continue, so every group boundary is a span start
+    group_starts = np.flatnonzero(~cont[tagged])
+    group_ends = np.append(group_starts[1:], len(tagged)) - 1
+    first, last = tagged[group_starts], tagged[group_ends]
+
+    if scores is None:
+        span_scores = np.ones(len(first))
+    else:
+        token_scores = np.asarray(scores, dtype=np.float64)[tagged]
+        span_scores = np.add.reduceat(token_scores, group_starts) / (group_ends - group_starts + 1)
+
+    keep = span_scores >= min_score
+    first, last = first[keep], last[keep]
+    return [
+        {"start": a, "end": b, "label": ENTITY_NAMES[e], "score": round(sc, 4)}
+        for a, b, e, sc in zip(starts[first].tolist(), ends[last].tolist(),
+                               entity[first].tolist(), span_scores[keep].tolist())
+    ]
 
 def bio_to_char_spans(offsets, tags):
     """Convert BIO tags to character spans."""
-    spans, cur = [], None
-    for (s, e), tag in zip(offsets, tags):
-        if tag.startswith("B-"):
-            if cur:
-                spans.append(cur)
-            cur = {"start": s, "end": e, "label": tag.split("-", 1)[1]}
-        elif tag.startswith("I-"):
-            ent = tag.split("-", 1)[1]
-            if cur and cur["label"] == ent and s <= cur["end"] + 1:
-                cur["end"] = e
-            else:
-                cur = {"start": s, "end": e, "label": ent}
-        else:
-            if cur:
-                spans.append(cur)
-                cur = None
-    if cur:
-        spans.append(cur)
-    return spans
+    return [
+        {"start": s["start"], "end": s["end"], "label": s["label"]}
+        for s in decode_bio_spans(offsets, [LABEL_IDS[t] for t in tags])
+    ]
 
 # Regex patterns for structured PII
 PII_PATTERNS = {
     "EMAIL": re.compile(r"\b[A-Za-z0-9._%+-]+@[A-Za-z0-9.-]+\.[A-Za-z]{2,}\b"),
-    "PHONE": re.compile(r"\b(?:\+?\d{1,3}[-.\s]?)?(?:\(?\d{1,4}\)?[-.\s]?)?\d{3,4}[-.\s]?\d{3,4}\b"),
+    "PHONE": re.compile(r"\b(?=[+(\d])(?:\+?\d{1,3}[-.\s]?)?(?:\(?\d{1,4}\)?[-.\s]?)?\d{3,4}[-.\s]?\d{3,4}\b"),
     "URL_PERSONAL": re.compile(r"\bhttps?://[^\s]+", re.I),
     "USERNAME": re.compile(r"@\w{1,32}")
 }
 
+# Something every match of a label must contain. Labels whose prefilter
+# finds nothing in the text are left out of the scan entirely.
+PII_PREFILTERS = {
+    "EMAIL": re.compile(r"@"),
+    "PHONE": re.compile(r"\d"),
+    "URL_PERSONAL": re.compile(r"http", re.I),
+    "USERNAME": re.compile(r"@"),
+}
+
 def regex_spans(text, target_labels=None):
-    """Extract PII spans using regex patterns, optionally filtered by target labels."""
+    """
+    Extract PII spans using regex patterns, optionally filtered by target labels.
+
+    Each label gets its own scan, so matches of different labels may
+    overlap and are left for merge_spans to resolve. A single alternation
+    would be no faster and would hide partial overlaps (an @-prefixed
+    phone number would come out as a short USERNAME). Labels whose
+    prefilter finds nothing in the text are not scanned.
+    """
     out = []
     for label, pattern in PII_PATTERNS.items():
         if target_labels and label not in target_labels:
             continue
+        if not PII_PREFILTERS[label].search(text):
+            continue
         for m in pattern.finditer(text):
             out.append({"start": m.start(), "end": m.end(), "label": label})
     return out
 
-def ner_spans(text, target_labels=None):
-    """Get named entity recognition spans, optionally filtered by target labels."""
-    tags, offs = predict_tags(text)
-    spans = bio_to_char_spans(offs, tags)
-    
+def ner_spans(text, target_labels=None, min_score=None):
+    """Get named entity recognition spans, optionally filtered by target labels and confidence."""
+    offs, ids, scores = predict_scores_batch([text])[0]
+    min_score = NER_MIN_SCORE if min_score is None else min_score
+    return filter_ner_spans(decode_bio_spans(offs, ids, scores, min_score), target_labels)
+
+def filter_ner_spans(spans, target_labels=None):
+    """Keep only NER spans whose label is in target_labels (all spans if None)."""
     if target_labels:
         spans = [span for span in spans if span["label"] in target_labels]
-    
     return spans
 
+# Signs that a text may hold a name or address the regexes cannot find
+# Capitalised words that commonly open a sentence without being a name
+NER_GATE_OPENERS = (
+    "A An And Also Any Are As At But Can Could Did Do Does Dont Explain Find For From Give Good Hello "
+    "Help Hey Hi How If In Is It Its Let Lets List Make Many May Maybe My No Not Now Of Ok Okay On "
+    "Or Our Please Pls Should Show So Some Sorry Summarise Summarize Tell Thank Thanks That The Then "
+    "There These They This Those To Translate We What When Where Which Who Why Will With Would Write "
+    "Yes You Your"
+).split()
+
+NER_GATE_PATTERN = re.compile(r"""
+    (?<=[a-z0-9,;:)]\s)[A-Z][a-z]                      # capitalised word mid-sentence
+  | (?:(?<![^\n])|(?<=[.!?]\s))                        # capitalised word starting the text, a line
+    (?!(?:""" + "|".join(NER_GATE_OPENERS) + r""")\b)  # or a sentence, unless it is a common opener
+    [A-Z][a-z]
+  | (?i:\b(?:my\s+name\s+is|i\s+am|i'm|call\s+me|this\s+is|named|
+           mr|mrs|ms|mdm|dr|address|live\s+(?:at|in|on)|lives\s+(?:at|in|on))\b)
+  | (?i:\b\d+[a-z]?\s+(?:[a-z'-]+\s+){0,3}
+        (?:street|st|road|rd|avenue|ave|lane|ln|drive|dr|way|boulevard|blvd|
+           crescent|close|place|jalan|jln|block|blk)\b)
+""", re.X)
+
+def ner_gate(text, gate=None):
+    """Decide whether the NER model needs to run on text under the given (or configured) gate."""
+    gate = gate or NER_GATE
+    if gate == "off":
+        return True
+    if gate == "lexical":
+        return NER_GATE_PATTERN.search(text) is not None
+    raise ValueError(f"Unknown NER gate: '{gate}'")
+
 def merge_spans(spans):
     """Merge overlapping spans."""
     spans = sorted(spans, key=lambda s: (s["start"], -(s["end"] - s["start"])))
@@ -124,33 +391,22 @@ def merge_spans(spans):
                 merged[-1] = s
     return merged
 
-def redact(text, target_labels=None):
-    ALL_LABELS = ["NAME", "ADDRESS", "EMAIL", "PHONE", "URL_PERSONAL", "USERNAME"]
-    if (target_labels != None):
-        target_labels = [item for item in ALL_LABELS if item not in target_labels]
+def resolve_target_labels(target_labels):
+    """Turn the list of labels to leave alone, as sent by the clients, into the set of labels to redact."""
+    if target_labels is None:
+        return None
+    return {item for item in ALL_LABELS if item not in target_labels}
 
+def combine_spans(text, ner_matches, target_labels=None):
     """
-    Redact PII entities with unique identifiers.
-    
+    Combine regex and NER spans for a text into sorted, non-overlapping spans.
+
     Args:
-        text: Input text to redact
-        target_labels: Set of labels to redact (e.g., {"NAME", "PHONE"}).
-                     If None, redacts all detected PII.
+        text: Input text the spans refer to
+        ner_matches: Spans found by the NER model, already filtered by label
+        target_labels: Set of labels to redact, or None for all of them
     """
-    # Get all available labels from both regex and NER
-    all_regex_labels = set(PII_PATTERNS.keys())
-    all_ner_labels = set(mdl.config.id2label.values())
-    all_ner_labels = {label.split("-", 1)[1] for label in all_ner_labels if "-" in label}
-    
-    # If target_labels is specified, use only those labels
-    if target_labels:
-        target_labels = set(target_labels)
-        regex_matches = regex_spans(text, target_labels)
-        ner_matches = ner_spans(text, target_labels)
-    else:
-        # Redact all detected PII (original behavior)
-        regex_matches = regex_spans(text)
-        ner_matches = ner_spans(text)
+    regex_matches = regex_spans(text, target_labels)
 
     keep = regex_matches[:]
     covered = {(s["start"], s["end"]) for s in regex_matches}
@@ -167,17 +423,44 @@ def redact(text, target_labels=None):
     extend_labels = {"NAME", "ADDRESS"}
     if target_labels:
         extend_labels = extend_labels.intersection(target_labels)
-    spans = extend_spans_to_word_end(spans, text, labels=extend_labels)
+    return extend_spans_to_word_end(spans, text, labels=extend_labels)
 
+def assign_entity_ids(spans, entity_counters=None, known_ids=None):
+    """
+    Give each span an "entity_id" like "NAME_1", numbered per label.
+
+    Args:
+        spans: Spans in text order
+        entity_counters: Per-label counts to continue from; updated in place
+        known_ids: (start, label) -> entity_id for spans that already have
+                   an identifier and should keep it
+    """
     # Count occurrences of each entity type
-    entity_counters = defaultdict(int)
+    if entity_counters is None:
+        entity_counters = defaultdict(int)
+    known_ids = known_ids or {}
 
     for span in spans:
         label = span["label"]
-        entity_counters[label] += 1
-        span["entity_id"] = f"{label}_{entity_counters[label]}"
+        entity_id = known_ids.get((span["start"], label))
+        if entity_id is None:
+            entity_counters[label] = entity_counters.get(label, 0) + 1
+            entity_id = f"{label}_{entity_counters[label]}"
+        span["entity_id"] = entity_id
+
+    return spans
 
-    # Build redacted text
+def finalize_spans(text, ner_matches, target_labels=None):
+    """
+    Combine regex and NER spans for a text and assign entity identifiers.
+
+    Returns:
+        Sorted, non-overlapping spans, each with an "entity_id" like "NAME_1".
+    """
+    return assign_entity_ids(combine_spans(text, ner_matches, target_labels))
+
+def render_redaction(text, spans):
+    """Replace each span in text with its [ENTITY_ID] placeholder."""
     out, last = [], 0
     for s in sorted(spans, key=lambda x: x["start"]):
         out.append(text[last:s["start"]])
@@ -187,9 +470,640 @@ def redact(text, target_labels=None):
     
     return "".join(out)
 
+def placeholder_table(text, spans):
+    """
+    Map each placeholder's entity id to what it replaced.
+
+    Returns:
+        {"NAME_1": {"text": "John", "label": "NAME", "start": 11, "end": 15}, ...}
+    """
+    return {
+        s["entity_id"]: {"text": text[s["start"]:s["end"]], "label": s["label"],
+                         "start": s["start"], "end": s["end"]}
+        for s in spans
+    }
+
+# Placeholders as written by render_redaction, e.g. [NAME_1]
+PLACEHOLDER_PATTERN = re.compile(r"\[([A-Z][A-Z_]*_\d+)\]")
+
+def rehydrate(text, table):
+    """
+    Put the original values back in place of placeholders, in one pass.
+
+    Placeholders missing from the table, such as ones a model made up,
+    are left as they are.
+
+    Args:
+        text: Text containing placeholders, such as a model's reply
+        table: Placeholder table returned by redact(..., return_table=True)
+    """
+    def restore(m):
+        entry = table.get(m.group(1))
+        return m.group(0) if entry is None else entry["text"]
+    return PLACEHOLDER_PATTERN.sub(restore, text)
+
+def compute_spans(texts, target_labels=None):
+    """
+    Final spans for each text, in input order.
+
+    Spans come from span_cache when possible. The remaining texts are
+    deduplicated, and those that pass the NER gate are tagged together in
+    length-bucketed batches.
+
+    Args:
+        texts: Input texts
+        target_labels: Set of labels to redact, or None for all of them
+    """
+    spans = [None] * len(texts)
+    keys = [span_key(text, target_labels, MODEL_REVISION) for text in texts] if span_cache else None
+    if span_cache:
+        spans = [span_cache.get(key) for key in keys]
+
+    pending = {}
+    for i, text in enumerate(texts):
+        if spans[i] is None:
+            pending.setdefault(text, []).append(i)
+
+    gated = [text for text in pending if ner_gate(text)]
+    tagged = dict(zip(gated, predict_scores_batch(gated)))
+
+    for text, indices in pending.items():
+        ner_matches = []
+        if text in tagged:
+            offs, ids, scores = tagged[text]
+            ner_matches = filter_ner_spans(decode_bio_spans(offs, ids, scores, NER_MIN_SCORE), target_labels)
+        text_spans = finalize_spans(text, ner_matches, target_labels)
+        if span_cache:
+            span_cache.put(keys[indices[0]], text_spans)
+        for i in indices:
+            spans[i] = text_spans
+    return spans
+
+def redact(text, target_labels=None, return_table=False):
+    """
+    Redact PII entities with unique identifiers.
+    
+    Args:
+        text: Input text to redact
+        target_labels: Labels to leave unredacted (e.g., ["NAME", "PHONE"]).
+                     If None, redacts all detected PII.
+        return_table: Also return the placeholder table, for rehydrate()
+
+    Returns:
+        The redacted text, or (redacted text, placeholder table) if return_table
+    """
+    target_labels = resolve_target_labels(target_labels)
+    spans = compute_spans([text], target_labels)[0]
+    redacted = render_redaction(text, spans)
+    if return_table:
+        return redacted, placeholder_table(text, spans)
+    return redacted
+
+def redact_batch(texts, target_labels=None):
+    """
+    Redact many texts at once, returning the redacted strings in input order.
+
+    All texts are tokenized together and their windows are sorted by length
+    into padded batches of at most NER_BATCH_TOKENS tokens, so bulk jobs pay
+    for far fewer forward passes than calling redact() per text. Cached,
+    repeated and gated-out texts are left out of the batches.
+
+    Args:
+        texts: Input texts to redact
+        target_labels: Labels to leave unredacted, as for redact()
+    """
+    target_labels = resolve_target_labels(target_labels)
+    return [render_redaction(text, spans) for text, spans in zip(texts, compute_spans(texts, target_labels))]
+
+def common_prefix_length(a, b):
+    """Length of the longest common prefix of two strings."""
+    lo, hi = 0, min(len(a), len(b))
+    if a[:hi] == b[:hi]:
+        return hi
+    # Binary search on slice comparisons, which run in C
+    while lo < hi:
+        mid = (lo + hi + 1) // 2
+        if a[:mid] == b[:mid]:
+            lo = mid
+        else:
+            hi = mid - 1
+    return lo
+
+def redaction_state(text, spans, target_labels, entity_counters):
+    """Everything redact_incremental() needs to pick up from this text next turn."""
+    return {
+        "length": len(text),
+        "labels": sorted(target_labels) if target_labels is not None else None,
+        "revision": MODEL_REVISION,
+        "spans": [{"start": s["start"], "end": s["end"], "label": s["label"],
+                   "entity_id": s["entity_id"]} for s in spans],
+        "counters": dict(entity_counters),
+    }
+
+def redact_incremental(prev_text, prev_state, text, target_labels=None, margin=INCREMENTAL_MARGIN):
+    """
+    Redact a text that extends a previously redacted one, such as a growing chat transcript.
+
+    Spans that end well before the point where the two texts diverge are
+    reused as they are, with the same entity identifiers. Detection runs
+    again only from `margin` characters before that point, so the model
+    sees some context and a name cut off at the old end is found whole.
+    New entities continue the previous numbering, so [NAME_1] stays the
+    same person across turns.
+
+    Args:
+        prev_text: The text prev_state was computed for
+        prev_state: State returned alongside prev_text, or None
+        text: The new text
+        target_labels: Labels to leave unredacted, as for redact()
+        margin: Characters before the divergence point to scan again
+
+    Returns:
+        (redacted text, state to pass along with text next turn)
+    """
+    target_labels = resolve_target_labels(target_labels)
+    labels_key = sorted(target_labels) if target_labels is not None else None
+
+    usable = (prev_state is not None
+              and prev_state.get("length") == len(prev_text)
+              and prev_state.get("labels") == labels_key
+              and prev_state.get("revision") == MODEL_REVISION)
+    if not usable:
+        spans = compute_spans([text], target_labels)[0]
+        counters = defaultdict(int)
+        for s in spans:
+            counters[s["label"]] += 1
+        return render_redaction(text, spans), redaction_state(text, spans, target_labels, counters)
+
+    prev_spans = prev_state["spans"]
+    cut = max(0, common_prefix_length(prev_text, text) - margin)
+    # Never split a previous span, and start the rescan on a word boundary
+    while True:
+        for s in prev_spans:
+            if s["start"] < cut < s["end"]:
+                cut = s["start"]
+        while cut > 0 and not text[cut - 1].isspace():
+            cut -= 1
+        if not any(s["start"] < cut < s["end"] for s in prev_spans):
+            break
+
+    kept = [dict(s) for s in prev_spans if s["end"] <= cut]
+    # A span found again at the same start is the same entity, even if it
+    # has grown because the previous text ended partway through it
+    known_ids = {(s["start"], s["label"]): s["entity_id"]
+                 for s in prev_spans if s["start"] >= cut}
+
+    tail = text[cut:]
+    ner_matches = []
+    if ner_gate(tail):
+        ner_matches = ner_spans(tail, target_labels)
+    tail_spans = combine_spans(tail, ner_matches, target_labels)
+    for s in tail_spans:
+        s["start"] += cut
+        s["end"] += cut
+
+    counters = defaultdict(int, prev_state.get("counters", {}))
+    spans = kept + assign_entity_ids(tail_spans, counters, known_ids)
+    return render_redaction(text, spans), redaction_state(text, spans, target_labels, counters)
+
+def stream_chunks(lines, chunk_chars=STREAM_CHUNK_CHARS):
+    """
+    Group lines into chunks of roughly chunk_chars characters.
+
+    Once a chunk reaches chunk_chars it ends at the next blank line, so
+    paragraphs stay together; past twice that it ends at the next line.
+    A single line longer than that becomes a chunk of its own.
+    """
+    buf, size = [], 0
+    for line in lines:
+        buf.append(line)
+        size += len(line)
+        if (size >= chunk_chars and not line.strip()) or size >= 2 * chunk_chars:
+            yield "".join(buf)
+            buf, size = [], 0
+    if buf:
+        yield "".join(buf)
+
+def redact_stream(lines, target_labels=None, chunk_chars=STREAM_CHUNK_CHARS,
+                  batch_chunks=STREAM_BATCH_CHUNKS):
+    """
+    Redact an iterable of lines, yielding redacted chunks as they are ready.
+
+    Only batch_chunks chunks are held at a time, so memory stays constant
+    however long the input is. Entity numbering carries on from one chunk
+    to the next, so the output reads as if the whole input had been
+    redacted in one call: the third name in the file is [NAME_3] whichever
+    chunk it falls in. Lines are passed through with their own line
+    endings, so joining the output reproduces the input layout.
+
+    Args:
+        lines: Iterable of strings, such as an open file
+        target_labels: Labels to leave unredacted, as for redact()
+        chunk_chars: Approximate chunk size in characters
+        batch_chunks: Number of chunks tagged together
+    """
+    target_labels = resolve_target_labels(target_labels)
+    counters = defaultdict(int)
+    batch = []
+
+    def flush():
+        for chunk, spans in zip(batch, compute_spans(batch, target_labels)):
+            # Cached span lists are shared, so renumber copies
+            spans = assign_entity_ids([dict(s) for s in spans], counters)
+            yield render_redaction(chunk, spans)
+        batch.clear()
+
+    for chunk in stream_chunks(lines, chunk_chars):
+        batch.append(chunk)
+        if len(batch) >= batch_chunks:
+            yield from flush()
+    yield from flush()
+
+def stream_main(argv):
+    """Command line for redact_stream(): redact files or stdin to stdout."""
+    import argparse
+
+    parser = argparse.ArgumentParser(prog="script.py --stream",
+                                     description="Redact PII from files or stdin, writing to stdout.")
+    parser.add_argument("files", nargs="*", help="Input files (default: stdin)")
+    parser.add_argument("--labels", default=None,
+                        help='JSON array of labels to leave unredacted, e.g. \'["NAME"]\'')
+    parser.add_argument("--chunk-chars", type=int, default=STREAM_CHUNK_CHARS)
+    args = parser.parse_args(argv)
+
+    labels = json.loads(args.labels) if args.labels else None
+    # Pass undecodable bytes through unchanged rather than failing mid-file
+    sys.stdout.reconfigure(encoding="utf-8", errors="surrogateescape")
+    if args.files:
+        def lines():
+            for path in args.files:
+                with open(path, encoding="utf-8", errors="surrogateescape", newline="") as f:
+                    yield from f
+        source = lines()
+    else:
+        sys.stdin.reconfigure(encoding="utf-8", errors="surrogateescape", newline="")
+        source = sys.stdin
+
+    for out in redact_stream(source, target_labels=labels, chunk_chars=args.chunk_chars):
+        sys.stdout.write(out)
+        sys.stdout.flush()
+
+def read_records(path, fmt):
+    """Yield the records of a JSONL or CSV file as dicts."""
+    import csv
+
+    with open(path, encoding="utf-8", newline="") as f:
+        if fmt == "csv":
+            yield from csv.DictReader(f)
+        else:
+            for line in f:
+                if line.strip():
+                    yield json.loads(line)
+
+def redact_block(block, target_labels, field):
+    """Pool task: redact the `field` value of each record in a block."""
+    texts = [r[field] for r in block if isinstance(r.get(field), str)]
+    redacted = iter(redact_batch(texts, target_labels=target_labels))
+    for r in block:
+        if isinstance(r.get(field), str):
+            r[field] = next(redacted)
+    return block
+
+def encode_records(records, fmt, fieldnames=None, header=False):
+    """Serialise records to bytes in the output format."""
+    import csv
+    import io
+
+    if fmt == "csv":
+        buf = io.StringIO()
+        writer = csv.DictWriter(buf, fieldnames=fieldnames)
+        if header:
+            writer.writeheader()
+        writer.writerows(records)
+        return buf.getvalue().encode("utf-8")
+    return "".join(json.dumps(r, ensure_ascii=False) + "\n" for r in records).encode("utf-8")
+
+def available_cores():
+    """Number of CPUs this process may run on."""
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:
+        return os.cpu_count() or 1
+
+def bulk_redact(input_path, output_path, field="text", target_labels=None, workers=None,
+                threads=None, block_size=64, fmt=None, restart=False):
+    """
+    Redact one field of every record in a JSONL or CSV file using a process pool.
+
+    Records are sent to the workers in blocks of block_size and written
+    back in input order as each block finishes. Each worker loads the model
+    once and runs inference on `threads` intra-op threads, by default the
+    available cores divided among the workers, so the pool does not
+    oversubscribe the CPU.
+
+    Progress is recorded in `<output_path>.ckpt` after every block. If a run
+    is interrupted, running the same command again truncates the output to
+    the last completed block and carries on from there, unless restart is
+    set. A checkpoint left by a run with a different input, field, label
+    set or format is ignored. The checkpoint is removed once the run
+    completes.
+
+    Returns:
+        Number of records written by this run
+    """
+    import itertools
+    import multiprocessing
+
+    fmt = fmt or ("csv" if input_path.lower().endswith(".csv") else "jsonl")
+    cores = available_cores()
+    workers = workers or max(1, min(4, cores))
+    threads = threads or max(1, cores // workers)
+    checkpoint_path = output_path + ".ckpt"
+
+    # What the output depends on; resuming under anything else would mix runs
+    run = {"input": os.path.abspath(input_path), "field": field, "format": fmt,
+           "labels": None if target_labels is None else sorted(target_labels)}
+
+    done, offset = 0, 0
+    if not restart and os.path.exists(checkpoint_path) and os.path.exists(output_path):
+        with open(checkpoint_path) as f:
+            checkpoint = json.load(f)
+        if all(checkpoint.get(key) == value for key, value in run.items()):
+            done, offset = checkpoint["records"], checkpoint["bytes"]
+
+    records = read_records(input_path, fmt)
+    fieldnames = None
+    if fmt == "csv":
+        first = next(records, None)
+        if first is None:
+            open(output_path, "wb").close()
+            return 0
+        fieldnames = list(first.keys())
+        records = itertools.chain([first], records)
+    records = itertools.islice(records, done, None)
+    blocks = iter(lambda: list(itertools.islice(records, block_size)), [])
+
+    # Workers read the thread count when they import this module. Spawned
+    # rather than forked, since forking after torch has started its thread
+    # pool can deadlock.
+    os.environ["PII_NER_THREADS"] = str(threads)
+    context = multiprocessing.get_context("spawn")
+    written = 0
+    with open(output_path, "r+b" if offset else "wb") as out, \
+            context.Pool(workers) as pool:
+        out.truncate(offset)
+        out.seek(offset)
+        header = offset == 0
+        tasks = ((block, target_labels, field) for block in blocks)
+        # imap keeps input order while up to `workers` blocks are in flight
+        for block in pool.imap(_redact_block_task, tasks):
+            out.write(encode_records(block, fmt, fieldnames, header=header))
+            out.flush()
+            os.fsync(out.fileno())
+            header = False
+            done += len(block)
+            written += len(block)
+            with open(checkpoint_path + ".tmp", "w") as f:
+                json.dump(dict(run, records=done, bytes=out.tell()), f)
+            os.replace(checkpoint_path + ".tmp", checkpoint_path)
+
+    if os.path.exists(checkpoint_path):
+        os.remove(checkpoint_path)
+    return written
+
+def _redact_block_task(args):
+    return redact_block(*args)
+
+def bulk_main(argv):
+    """Command line for bulk_redact()."""
+    import argparse
+
+    parser = argparse.ArgumentParser(prog="script.py --bulk",
+                                     description="Redact a text field across a JSONL or CSV file.")
+    parser.add_argument("input", help="Input .jsonl or .csv file")
+    parser.add_argument("output", help="Output file, same format as the input")
+    parser.add_argument("--field", default="text", help="JSON field or CSV column to redact")
+    parser.add_argument("--labels", default=None, help="JSON array of labels to leave unredacted")
+    parser.add_argument("--workers", type=int, default=None, help="Worker processes (default: min(4, cores))")
+    parser.add_argument("--threads", type=int, default=None, help="Inference threads per worker")
+    parser.add_argument("--block-size", type=int, default=64, help="Records per task")
+    parser.add_argument("--restart", action="store_true", help="Ignore any checkpoint and start over")
+    args = parser.parse_args(argv)
+
+    start = time.perf_counter()
+    count = bulk_redact(args.input, args.output, field=args.field,
+                        target_labels=json.loads(args.labels) if args.labels else None,
+                        workers=args.workers, threads=args.threads,
+                        block_size=args.block_size, restart=args.restart)
+    elapsed = time.perf_counter() - start
+    print(f"Redacted {count} records in {elapsed:.1f}s", file=sys.stderr)
+
+# Joins a column's cells for a single regex pass. No pattern can match
+# across it: \x00 is neither a word character nor whitespace, and the
+# newline stops URL matches, which are clipped back to their cell.
+COLUMN_SEPARATOR = "\x00\n"
+
+def column_regex_spans(values, target_labels=None):
+    """
+    Regex spans for each of a column's values, found in one scan of the whole column.
+
+    Args:
+        values: Distinct cell values of one column
+        target_labels: Set of labels to redact, or None for all of them
+
+    Returns:
+        One list of spans per value, with offsets into that value
+    """
+    starts, pos = [], 0
+    for value in values:
+        starts.append(pos)
+        pos += len(value) + len(COLUMN_SEPARATOR)
+    spans = [[] for _ in values]
+    i = 0
+    for span in regex_spans(COLUMN_SEPARATOR.join(values), target_labels):
+        while i + 1 < len(starts) and starts[i + 1] <= span["start"]:
+            i += 1
+        end = min(span["end"] - starts[i], len(values[i]))
+        spans[i].append({"start": span["start"] - starts[i], "end": end, "label": span["label"]})
+    return spans
+
+def redact_columns(records, text_fields, fields=None, target_labels=None, stats=None):
+    """
+    Redact the string cells of a batch of records column by column, in place.
+
+    Columns in text_fields are free text and go through compute_spans(),
+    which runs batched NER on them. The other columns in fields (every
+    column when None) are structured and only get the regex detectors,
+    run once over all of the column's distinct values. Each distinct value
+    is processed once per batch, however many cells hold it.
+
+    Args:
+        records: Batch of dicts, as read by read_records()
+        text_fields: Columns that hold free text
+        fields: Columns to redact, or None for all of them
+        target_labels: Set of labels to redact, or None for all of them
+        stats: Per-column counters to update, as returned by redact_dataset()
+    """
+    columns = fields or list(dict.fromkeys(k for r in records for k in r))
+    for column in columns:
+        values = list(dict.fromkeys(
+            r[column] for r in records if isinstance(r.get(column), str) and r[column]))
+        if column in text_fields:
+            value_spans = compute_spans(values, target_labels)
+        else:
+            value_spans = [
+                assign_entity_ids(coalesce_same_label_spans(merge_spans(spans), value))
+                for value, spans in zip(values, column_regex_spans(values, target_labels))
+            ]
+        redacted = {value: render_redaction(value, spans) for value, spans in zip(values, value_spans)}
+
+        if stats is not None:
+            column_stats = stats.setdefault(column, {
+                "mode": "ner" if column in text_fields else "regex",
+                "cells": 0, "distinct": 0, "redacted_cells": 0, "entities": {}})
+            column_stats["distinct"] += len(values)
+            found = dict(zip(values, value_spans))
+        for r in records:
+            value = r.get(column)
+            # Nested lists and dicts are left alone, and cannot be looked up
+            if not isinstance(value, str) or value not in redacted:
+                continue
+            r[column] = redacted[value]
+            if stats is not None:
+                column_stats["cells"] += 1
+                if found[value]:
+                    column_stats["redacted_cells"] += 1
+                for span in found[value]:
+                    column_stats["entities"][span["label"]] = column_stats["entities"].get(span["label"], 0) + 1
+    return records
+
+def redact_dataset(input_path, output_path, text_fields=(), fields=None, target_labels=None,
+                   batch_size=256, fmt=None):
+    """
+    Redact a JSONL or CSV dataset batch by batch, with NER only on free-text columns.
+
+    Records are read and written batch_size at a time, so memory does not
+    grow with the file. See redact_columns() for how each column is handled.
+
+    Args:
+        input_path: Input .jsonl or .csv file
+        output_path: Output file, written in the same format
+        text_fields: Columns that hold free text and get NER
+        fields: Columns to redact, or None for all of them
+        target_labels: Labels to leave unredacted, as for redact()
+        batch_size: Records per batch
+
+    Returns:
+        Per-column stats: {"notes": {"mode": "ner", "cells": 120, "distinct": 97,
+        "redacted_cells": 31, "entities": {"NAME": 40}}, ...}
+    """
+    import itertools
+
+    fmt = fmt or ("csv" if input_path.lower().endswith(".csv") else "jsonl")
+    target_labels = resolve_target_labels(target_labels)
+    text_fields = set(text_fields)
+    stats = {}
+    records = read_records(input_path, fmt)
+    fieldnames = None
+    with open(output_path, "wb") as out:
+        for batch in iter(lambda: list(itertools.islice(records, batch_size)), []):
+            if fmt == "csv" and fieldnames is None:
+                fieldnames = list(batch[0].keys())
+            redact_columns(batch, text_fields, fields, target_labels, stats)
+            out.write(encode_records(batch, fmt, fieldnames, header=out.tell() == 0))
+            out.flush()
+    return stats
+
+def dataset_main(argv):
+    """Command line for redact_dataset()."""
+    import argparse
+
+    parser = argparse.ArgumentParser(prog="script.py --dataset",
+                                     description="Redact the columns of a JSONL or CSV dataset.")
+    parser.add_argument("input", help="Input .jsonl or .csv file")
+    parser.add_argument("output", help="Output file, same format as the input")
+    parser.add_argument("--text-fields", default="", help="Comma-separated free-text columns to run NER on")
+    parser.add_argument("--fields", default=None, help="Comma-separated columns to redact (default: all)")
+    parser.add_argument("--labels", default=None, help="JSON array of labels to leave unredacted")
+    parser.add_argument("--batch-size", type=int, default=256, help="Records per batch")
+    args = parser.parse_args(argv)
+
+    stats = redact_dataset(args.input, args.output,
+                           text_fields=[f for f in args.text_fields.split(",") if f],
+                           fields=args.fields.split(",") if args.fields else None,
+                           target_labels=json.loads(args.labels) if args.labels else None,
+                           batch_size=args.batch_size)
+    print(json.dumps(stats, indent=2), file=sys.stderr)
+
+def serve(stream_in=sys.stdin, stream_out=sys.stdout):
+    """
+    Serve redaction requests as JSON lines until the input stream closes.
+
+    Each request is a JSON object with a "text" field, an optional "labels"
+    list (same meaning as the command-line labels argument) and an optional
+    "id" that is echoed back. Each response carries the redacted text under
+    "response" and the time spent on the request under "latency_ms".
+    A request may send a "texts" list instead, which is redacted with
+    redact_batch() and answered with a "responses" list, or
+    {"command": "stats"} to get the span cache counters under "stats".
+    A request that also sends "previous": {"text", "state"} is redacted
+    with redact_incremental(), and the reply carries the new "state".
+    Single-text requests that set "placeholders": true also get the
+    placeholder table under "placeholders", for rehydrating replies.
+    """
+    for line in stream_in:
+        line = line.strip()
+        if not line:
+            continue
+
+        start = time.perf_counter()
+        request_id = None
+        try:
+            request = json.loads(line)
+            request_id = request.get("id")
+            labels = request.get("labels") or None
+            if request.get("command") == "stats":
+                reply = {"id": request_id, "stats": span_cache.snapshot() if span_cache else None}
+            elif request.get("previous") is not None:
+                previous = request["previous"]
+                result, state = redact_incremental(previous.get("text", ""), previous.get("state"),
+                                                   request.get("text", ""), target_labels=labels)
+                reply = {"id": request_id, "response": result, "state": state}
+                if request.get("placeholders"):
+                    reply["placeholders"] = placeholder_table(request.get("text", ""), state["spans"])
+            elif "texts" in request:
+                reply = {"id": request_id, "responses": redact_batch(request["texts"], target_labels=labels)}
+            elif request.get("placeholders"):
+                result, table = redact(request.get("text", ""), target_labels=labels, return_table=True)
+                reply = {"id": request_id, "response": result, "placeholders": table}
+            else:
+                reply = {"id": request_id, "response": redact(request.get("text", ""), target_labels=labels)}
+        except Exception as e:
+            reply = {"id": request_id, "error": str(e)}
+        reply["latency_ms"] = round((time.perf_counter() - start) * 1000, 3)
+
+        stream_out.write(json.dumps(reply) + "\n")
+        stream_out.flush()
+
 if __name__ == "__main__":
     # Read arguments from Node.js
-    if len(sys.argv) > 2:
+    if len(sys.argv) > 1 and sys.argv[1] == "--serve":
+        # Keep the model resident and answer requests from stdin
+        serve()
+        sys.exit(0)
+    elif len(sys.argv) > 1 and sys.argv[1] == "--stream":
+        # Redact files or stdin chunk by chunk, writing as it goes
+        stream_main(sys.argv[2:])
+        sys.exit(0)
+    elif len(sys.argv) > 1 and sys.argv[1] == "--bulk":
+        # Redact a JSONL/CSV corpus across a pool of worker processes
+        bulk_main(sys.argv[2:])
+        sys.exit(0)
+    elif len(sys.argv) > 1 and sys.argv[1] == "--dataset":
+        # Redact chosen columns of a JSONL/CSV dataset, NER on free text only
+        dataset_main(sys.argv[2:])
+        sys.exit(0)
+    elif len(sys.argv) > 2:
         # If specific labels are provided as second argument
         text = sys.argv[1]
         labels = json.loads(sys.argv[2])  # Expecting JSON array of labels
@@ -0,0 +1,103 @@
+"""
+Content-addressed cache of redaction spans.
+
+Entries are keyed by a hash of the exact text, the labels being redacted
+and the model revision, and hold the final spans rather than the redacted
+string, so callers can render or inspect them as they like. A bounded
+in-memory LRU sits in front of an optional SQLite file that survives
+restarts and can be shared by several workers.
+"""
+import hashlib
+import json
+import os
+import sqlite3
+import time
+from collections import OrderedDict
+
+def span_key(text, target_labels, revision):
+    """Hash the inputs that determine a text's spans."""
+    labels = ",".join(sorted(target_labels)) if target_labels is not None else "*"
+    h = hashlib.sha256()
+    for part in (revision, labels, text):
+        h.update(part.encode("utf-8", "surrogatepass"))
+        h.update(b"\0")
+    return h.hexdigest()
+
+def _pack(spans):
+    return [(s["start"], s["end"], s["label"], s["entity_id"]) for s in spans]
+
+def _unpack(rows):
+    return [{"start": a, "end": b, "label": label, "entity_id": eid} for a, b, label, eid in rows]
+
+class SpanCache:
+
+    def __init__(self, max_entries: int = 1024, disk_path: str = None, max_disk_entries: int = 100_000):
+        self.max_entries = int(max_entries)
+        self.max_disk_entries = int(max_disk_entries)
+        self.memory = OrderedDict()
+        self.puts = 0
+        self.stats = {"hits": 0, "disk_hits": 0, "misses": 0, "evictions": 0, "disk_evictions": 0}
+
+        self.db = None
+        if disk_path:
+            os.makedirs(os.path.dirname(os.path.abspath(disk_path)), exist_ok=True)
+            self.db = sqlite3.connect(disk_path, timeout=10, isolation_level=None)
+            self.db.execute("PRAGMA journal_mode=WAL")
+            self.db.execute(
+                "CREATE TABLE IF NOT EXISTS spans (key TEXT PRIMARY KEY, spans TEXT, used REAL)")
+            self.db.execute("CREATE INDEX IF NOT EXISTS spans_used ON spans (used)")
+
+    def get(self, key):
+        """Return the cached spans for key, or None."""
+        rows = self.memory.get(key)
+        if rows is not None:
+            self.memory.move_to_end(key)
+            self.stats["hits"] += 1
+            return _unpack(rows)
+
+        if self.db is not None:
+            found = self.db.execute("SELECT spans FROM spans WHERE key = ?", (key,)).fetchone()
+            if found is not None:
+                self.db.execute("UPDATE spans SET used = ? WHERE key = ?", (time.time(), key))
+                rows = [tuple(r) for r in json.loads(found[0])]
+                self._remember(key, rows)
+                self.stats["disk_hits"] += 1
+                return _unpack(rows)
+
+        self.stats["misses"] += 1
+        return None
+
+    def put(self, key, spans):
+        rows = _pack(spans)
+        self._remember(key, rows)
+        if self.db is not None:
+            self.db.execute("INSERT OR REPLACE INTO spans VALUES (?, ?, ?)",
+                            (key, json.dumps(rows), time.time()))
+            # Counting rows is a table scan, so only check the bound now and then
+            self.puts += 1
+            if self.puts % 256 == 0:
+                self._trim_disk()
+
+    def _remember(self, key, rows):
+        if self.max_entries <= 0:
+            return
+        self.memory[key] = rows
+        self.memory.move_to_end(key)
+        while len(self.memory) > self.max_entries:
+            self.memory.popitem(last=False)
+            self.stats["evictions"] += 1
+
+    def _trim_disk(self):
+        count = self.db.execute("SELECT COUNT(*) FROM spans").fetchone()[0]
+        extra = count - self.max_disk_entries
+        if extra > 0:
+            self.db.execute(
+                "DELETE FROM spans WHERE key IN (SELECT key FROM spans ORDER BY used LIMIT ?)", (extra,))
+            self.stats["disk_evictions"] += extra
+
+    def snapshot(self):
+        """Counters plus current sizes, for reporting."""
+        out = dict(self.stats, entries=len(self.memory))
+        if self.db is not None:
+            out["disk_entries"] = self.db.execute("SELECT COUNT(*) FROM spans").fetchone()[0]
+        return out
@@ -23,7 +23,10 @@ import {
 } from "@/components/ui/dialog";
 import { Separator } from "@/components/ui/separator";
 import { Moon, Sun, Settings, FolderOpen } from "lucide-react";
-import { replacePlaceholdersFromOriginal } from "@/services/piiReplacementService";
+import {
+  replacePlaceholdersFromOriginal,
+  restorePlaceholders,
+} from "@/services/piiReplacementService";
 import { fileStorageService } from "@/services/fileStorageService";
 import { StorageSettings } from "./StorageSettings";
 import PiiFilters from "./PiiFilters";
@@ -194,10 +197,9 @@ export function ChatInterface() {
       };
       setMessages((prev) => [...prev, geminiMessage]);
 
-      const restored = replacePlaceholdersFromOriginal(
-        finalMessage,
-        gemini.message
-      );
+      const restored = response.placeholders
+        ? restorePlaceholders(gemini.message, response.placeholders)
+        : replacePlaceholdersFromOriginal(finalMessage, gemini.message);
       const restoredMessage: ChatMessageType = {
         id: uuidv4(),
         role: "assistant",
@@ -0,0 +1,174 @@
+import { spawn, ChildProcessWithoutNullStreams } from "child_process";
+
+// Long-lived Python workers that speak JSON lines over stdin/stdout.
+// Each request is written as one JSON object carrying an `id`, and the
+// worker answers with one JSON object echoing that `id`.
+
+type Pending = {
+  payload: Record<string, unknown>;
+  resolve: (value: any) => void;
+  reject: (reason: Error) => void;
+  timer?: ReturnType<typeof setTimeout>;
+};
+
+type Worker = {
+  proc: ChildProcessWithoutNullStreams;
+  pending: Map<number, Pending>;
+  buffer: string;
+  stderr: string;
+  // Set once the worker has answered anything, i.e. its model is loaded
+  ready: boolean;
+};
+
+export interface PythonWorkerPoolOptions {
+  command: string;
+  args: string[];
+  size: number;
+  // Milliseconds a worker may spend on one request before it is killed
+  // (0 waits forever). The clock starts when the worker reaches the
+  // request, and a fresh worker's first request, which includes loading
+  // the model, is not timed.
+  timeoutMs?: number;
+}
+
+export class PythonWorkerPool {
+  private workers: Worker[] = [];
+  private nextId = 1;
+
+  constructor(private options: PythonWorkerPoolOptions) {}
+
+  request(payload: Record<string, unknown>): Promise<any> {
+    return new Promise((resolve, reject) => {
+      this.dispatch({ payload, resolve, reject });
+    });
+  }
+
+  private dispatch(pending: Pending) {
+    const worker = this.pickWorker();
+    const id = this.nextId++;
+    worker.pending.set(id, pending);
+    worker.proc.stdin.write(JSON.stringify({ ...pending.payload, id }) + "\n");
+    this.startClock(worker);
+  }
+
+  // Workers answer in order, so the oldest pending request is the one
+  // running; time it once the worker is warm
+  private startClock(worker: Worker) {
+    const timeoutMs = this.options.timeoutMs ?? 30000;
+    if (!worker.ready || timeoutMs <= 0) return;
+    const head = worker.pending.entries().next();
+    if (head.done) return;
+    const [id, pending] = head.value;
+    if (pending.timer) return;
+    pending.timer = setTimeout(() => this.timeOut(worker, id, timeoutMs), timeoutMs);
+  }
+
+  // A hung worker would hold its requests forever: fail the late request,
+  // kill the worker and send the requests queued behind it elsewhere
+  private timeOut(worker: Worker, id: number, timeoutMs: number) {
+    const late = worker.pending.get(id);
+    if (!late) return;
+    worker.pending.delete(id);
+    this.workers = this.workers.filter((w) => w !== worker);
+    const queued = [...worker.pending.values()];
+    worker.pending.clear();
+    worker.proc.kill();
+
+    late.reject(new Error(`Python worker did not answer within ${timeoutMs} ms`));
+    for (const pending of queued) this.dispatch(pending);
+  }
+
+  // Spawn workers up to the pool size, then hand out the least busy one
+  private pickWorker(): Worker {
+    if (this.workers.length < this.options.size) {
+      const worker = this.spawnWorker();
+      this.workers.push(worker);
+      return worker;
+    }
+    return this.workers.reduce((a, b) =>
+      b.pending.size < a.pending.size ? b : a
+    );
+  }
+
+  private spawnWorker(): Worker {
+    const proc = spawn(this.options.command, this.options.args);
+    const worker: Worker = {
+      proc,
+      pending: new Map(),
+      buffer: "",
+      stderr: "",
+      ready: false,
+    };
+
+    proc.stdout.on("data", (data) => {
+      worker.buffer += data.toString();
+      let newline = worker.buffer.indexOf("\n");
+      while (newline !== -1) {
+        const line = worker.buffer.slice(0, newline).trim();
+        worker.buffer = worker.buffer.slice(newline + 1);
+        if (line) this.handleLine(worker, line);
+        newline = worker.buffer.indexOf("\n");
+      }
+    });
+
+    // Writing to a worker that has exited but not yet closed raises EPIPE
+    // here; without a listener it would crash the server
+    proc.stdin.on("error", (err) => {
+      this.retire(worker, new Error(`Python worker stdin failed: ${err.message}`));
+    });
+
+    proc.stderr.on("data", (data) => {
+      // Keep only the tail so a chatty worker cannot grow this unbounded
+      worker.stderr = (worker.stderr + data.toString()).slice(-4096);
+    });
+
+    proc.on("close", (code) => {
+      this.retire(
+        worker,
+        new Error(`Python worker exited with code ${code}: ${worker.stderr}`)
+      );
+    });
+
+    proc.on("error", (err) => {
+      this.retire(
+        worker,
+        new Error(`Failed to start Python process: ${err.message}`)
+      );
+    });
+
+    return worker;
+  }
+
+  private handleLine(worker: Worker, line: string) {
+    let message: any;
+    try {
+      message = JSON.parse(line);
+    } catch (e) {
+      console.error("Raw Python output:", line);
+      return;
+    }
+
+    const pending = worker.pending.get(message.id);
+    if (!pending) return;
+    worker.pending.delete(message.id);
+    clearTimeout(pending.timer);
+    worker.ready = true;
+    this.startClock(worker);
+
+    if (message.error) {
+      pending.reject(new Error(`Python worker error: ${message.error}`));
+    } else {
+      pending.resolve(message);
+    }
+  }
+
+  // Drop a dead worker; the next request spawns a replacement
+  private retire(worker: Worker, error: Error) {
+    this.workers = this.workers.filter((w) => w !== worker);
+    for (const pending of worker.pending.values()) {
+      clearTimeout(pending.timer);
+      pending.reject(error);
+    }
+    worker.pending.clear();
+  }
+}
@@ -1,5 +1,6 @@
 import axios, { AxiosInstance } from "axios";
 import { PatternComponent } from "./patternService";
+import { PlaceholderTable } from "./piiReplacementService";
 
 export interface ChatMessage {
   id: string;
@@ -34,6 +35,8 @@ export interface SendMessageResponse {
   audioUrl?: string;
   imageUrl?: string;
   imageName?: string;
+  // Placeholder -> original value, for restoring the model's reply
+  placeholders?: PlaceholderTable;
 }
 
 export interface GeminiResponse {
@@ -136,44 +139,40 @@ class ApiService {
       if (request.customPatterns && request.customPatterns.length > 0) {
         console.log("Applying custom patterns via pattern API...");
 
-        // Group patterns by preset (assuming patterns from same preset are consecutive)
-        // For now, we'll apply all patterns sequentially
-        for (let i = 0; i < request.customPatterns.length; i++) {
-          const pattern = request.customPatterns[i];
-          console.log(
-            `Applying pattern ${i + 1}/${request.customPatterns.length}:`,
-            pattern
-          );
-
-          try {
-            const patternRequest = {
-              text: processedMessage, // Use the processed message from previous iteration
-              pattern_sequence: [pattern], // Apply one pattern at a time
-              replace_by: "[BLURRED]",
-            };
-
-            const patternResponse = await fetch(`/api/pattern`, {
-              method: "POST",
-              headers: { "Content-Type": "application/json" },
-              body: JSON.stringify(patternRequest),
-            });
-
-            if (patternResponse.ok) {
-              const patternResult = await patternResponse.json();
-              processedMessage = patternResult.processed;
-              console.log(
-                `Pattern ${i + 1} applied successfully. New text:`,
-                processedMessage
-              );
-            } else {
-              console.error(
-                `Pattern ${i + 1} API error:`,
-                await patternResponse.text()
-              );
-            }
-          } catch (error) {
-            console.error(`Error applying pattern ${i + 1}:`, error);
+        // Every component is its own pattern; the API applies them all in one pass
+        try {
+          const patternResponse = await fetch(`/api/pattern`, {
+            method: "POST",
+            headers: { "Content-Type": "application/json" },
+            body: JSON.stringify({
+              text: processedMessage,
+              patterns: request.customPatterns.map((pattern) => ({
+                pattern_sequence: [pattern],
+                replace_by: "[BLURRED]",
+              })),
+            }),
+          });
+
+          if (patternResponse.ok) {
+            const patternResult = await patternResponse.json();
+            processedMessage = patternResult.processed;
+            console.log("Custom patterns applied. New text:", processedMessage);
+          } else {
+            console.error(
+              "Pattern API error, retrying one pattern at a time:",
+              await patternResponse.text()
+            );
+            processedMessage = await this.applyPatternsOneByOne(
+              processedMessage,
+              request.customPatterns
+            );
           }
+        } catch (error) {
+          console.error("Error applying custom patterns, retrying one pattern at a time:", error);
+          processedMessage = await this.applyPatternsOneByOne(
+            processedMessage,
+            request.customPatterns
+          );
         }
       }
 
@@ -202,12 +201,44 @@ class ApiService {
       response = {
         message: data.response,
         type: "text",
+        placeholders: data.placeholders,
       };
     }
 
     return response;
   }
 
+  // One bad pattern (malformed, or over the time budget) fails the combined
+  // request, so apply them separately and skip only the ones that fail
+  private async applyPatternsOneByOne(text: string, patterns: PatternComponent[]): Promise<string> {
+    for (let i = 0; i < patterns.length; i++) {
+      try {
+        const patternResponse = await fetch(`/api/pattern`, {
+          method: "POST",
+          headers: { "Content-Type": "application/json" },
+          body: JSON.stringify({
+            text,
+            pattern_sequence: [patterns[i]],
+            replace_by: "[BLURRED]",
+          }),
+        });
+
+        if (patternResponse.ok) {
+          const patternResult = await patternResponse.json();
+          text = patternResult.processed;
+        } else {
+          console.error(
+            `Pattern ${i + 1} API error:`,
+            await patternResponse.text()
+          );
+        }
+      } catch (error) {
+        console.error(`Error applying pattern ${i + 1}:`, error);
+      }
+    }
+    return text;
+  }
+
   async callGemini(
     message: string,
     imageName?: string
@@ -56,3 +56,20 @@ export function replacePlaceholdersFromOriginal(
 
   return result;
 }
+
+export type PlaceholderTable = Record<
+  string,
+  { text: string; label: string; start: number; end: number }
+>;
+
+// Swap each placeholder for the value it replaced, using the table the
+// text API returns, in a single pass. Unknown placeholders are kept.
+export function restorePlaceholders(
+  templatedText: string,
+  table: PlaceholderTable
+): string {
+  return templatedText.replace(
+    /\[([A-Z][A-Z_]*_\d+)\]/g,
+    (match, id: string) => table[id]?.text ?? match
+  );
+}